@@ -0,0 +1,79 @@
+import time
+
+import numpy as np
+
+
+def render_curve(curve, resolution=0.01, duration=None, levels=128, scale=127):
+    if isinstance(curve, np.ndarray) and curve.ndim == 1:
+        if duration is None:
+            raise ValueError("render_curve: sampled curves require a duration")
+        t = np.linspace(0.0, duration, len(curve))
+        v = curve.astype(float)
+    else:
+        points = np.asarray(curve, dtype=float)
+        if points.ndim != 2 or points.shape[1] != 2:
+            raise ValueError(
+                f"render_curve: {curve}: expected (time, value) breakpoints or a 1-D array"
+            )
+        points = points[np.argsort(points[:, 0], kind="stable")]
+        t, v = points[:, 0], points[:, 1]
+    grid = np.arange(t[0], t[-1] + resolution / 2, resolution)
+    values = np.interp(grid, t, v) * ((levels - 1) / scale)
+    values = np.clip(np.rint(values), 0, levels - 1).astype(np.int64)
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return grid[keep], values[keep]
+
+
+def wait_until(deadline, spin=0.002):
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return
+        if remaining > spin:
+            time.sleep(remaining - spin)
+
+
+class Automation:
+    def __init__(self, mf):
+        self.mf = mf
+        self._controls = []
+        self._times, self._which, self._values = [], [], []
+
+    def add(self, control, curve, resolution=0.01, duration=None, offset=0.0):
+        affordance = self.mf._affordance_types.Midi_Slider.value[control.name]
+        states = self.mf._states[affordance]
+        times, values = render_curve(
+            curve, resolution, duration, len(states), states[-1]
+        )
+        self._times.append(times + offset)
+        self._which.append(np.full(len(times), len(self._controls)))
+        self._values.append(values)
+        self._controls.append(affordance)
+        return len(times)
+
+    def stream(self):
+        if not self._times:
+            return []
+        times = np.concatenate(self._times)
+        which = np.concatenate(self._which)
+        values = np.concatenate(self._values)
+        order = np.argsort(times, kind="stable")
+        return [
+            (
+                float(times[i]),
+                self._controls[which[i]],
+                self.mf._states[self._controls[which[i]]][int(values[i])],
+            )
+            for i in order
+        ]
+
+    def play(self, start=None, spin=0.002):
+        events = self.stream()
+        start = time.perf_counter() if start is None else start
+        late = 0.0
+        for t, affordance, value in events:
+            wait_until(start + t, spin)
+            late = max(late, time.perf_counter() - start - t)
+            self.mf.do(affordance, value)
+        return {"events": len(events), "max_late_s": late}
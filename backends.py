@@ -0,0 +1,386 @@
+import re
+import time
+
+import mido
+import numpy as np
+
+from options import Options
+
+_MODIFIER_KEYS = {"shift": "VK_SHIFT", "ctrl": "VK_CONTROL", "alt": "VK_MENU"}
+
+
+_KEY_TOKEN = re.compile(r"\{([^\s{}]+|[{}])(?: (\w+))?\}|(.)", re.S)
+
+
+class Backend:
+    def attach(self, mf):
+        pass
+
+    def start(self, executable_path, outport_name):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def window_rect(self):
+        raise NotImplementedError
+
+    def click(self, coords, button="left", modifier=None):
+        raise NotImplementedError
+
+    def press(self, coords):
+        raise NotImplementedError
+
+    def release(self, coords):
+        raise NotImplementedError
+
+    def drag(self, start, end):
+        raise NotImplementedError
+
+    def scroll(self, coords, ticks):
+        raise NotImplementedError
+
+    def send_keys(self, keys):
+        raise NotImplementedError
+
+    def send(self, msg):
+        raise NotImplementedError
+
+    def send_many(self, msgs):
+        for msg in msgs:
+            self.send(msg)
+
+    def read(self, affordance):
+        return None
+
+    def capture(self):
+        raise NotImplementedError
+
+    def on_geometry_change(self, callback):
+        pass
+
+
+class Pywinauto_Backend(Backend):
+    def __init__(self, window_title=None):
+        from pywinauto import Application, mouse, keyboard
+
+        self.app = Application()
+        self.mouse = mouse
+        self.keyboard = keyboard
+        self.window_title = window_title
+        self._window = None
+        self._outport = None
+
+    def start(self, executable_path, outport_name):
+        self.app.start(executable_path)
+        self._window = None
+        self._outport = mido.open_output(outport_name)
+
+    def stop(self):
+        self.app.kill()
+        self._outport.close()
+
+    def window_rect(self):
+        if self._window is None:
+            # bind to the window of the process this backend started, so several
+            # instances can run side by side without sharing a title lookup
+            if self.window_title is None:
+                self._window = self.app.top_window().wrapper_object()
+            else:
+                self._window = self.app.window(title=self.window_title).wrapper_object()
+        rect = self._window.rectangle()
+        return rect.left, rect.top, rect.right, rect.bottom
+
+    def click(self, coords, button="left", modifier=None):
+        if modifier is not None:
+            self.keyboard.send_keys(f"{{{_MODIFIER_KEYS[modifier]} down}}")
+        self.mouse.click(button=button, coords=coords)
+        if modifier is not None:
+            self.keyboard.send_keys(f"{{{_MODIFIER_KEYS[modifier]} up}}")
+
+    def press(self, coords):
+        self.mouse.press(coords=coords)
+
+    def release(self, coords):
+        self.mouse.release(coords=coords)
+
+    def drag(self, start, end):
+        self.mouse.press(coords=start)
+        self.mouse.move(coords=end)
+        self.mouse.release(coords=end)
+
+    def scroll(self, coords, ticks):
+        self.mouse.scroll(coords=coords, wheel_dist=ticks)
+
+    def send_keys(self, keys):
+        self.keyboard.send_keys(keys, with_spaces=True)
+
+    def capture(self):
+        self.window_rect()
+        return np.asarray(self._window.capture_as_image().convert("RGB"))
+
+    def send(self, msg):
+        if (
+            isinstance(self._outport, mido.ports.BaseOutput)
+            and not self._outport.closed
+        ):
+            self._outport.send(msg)
+
+
+class Fake_Backend(Backend):
+    def __init__(
+        self, rect=(0, 0, 1942, 1295), latency=None, drag_scale=1.3, wheel_step=1
+    ):
+        self.rect = rect
+        self.drag_scale = drag_scale
+        self.wheel_step = wheel_step
+        self.latency = dict(latency or {})
+        self.events = []
+        self.messages = []
+        self.ui = {}
+        self._geometry_callbacks = []
+        self.running = False
+        self._menu = None
+        self._highlight = -1
+        self._input_at = 0.0
+        self._shown = {}
+
+    def attach(self, mf):
+        self.mf = mf
+        self.ui = {a: s for a, s in mf._state.items() if a not in mf._programmatic}
+        self._targets = {}
+        for afford, spec in mf._spec.items():
+            if afford in mf._programmatic:
+                continue
+            for key, record in spec.items():
+                if isinstance(record, dict):
+                    point, required, selection = (
+                        record["point"],
+                        record["required"],
+                        key,
+                    )
+                else:
+                    point, required, selection = key, record, None
+                self._targets.setdefault(self._key(point), []).append(
+                    (afford, selection, required)
+                )
+
+    def _wait(self, op):
+        delay = self.latency.get(op)
+        if delay:
+            time.sleep(delay)
+        if op != "midi" and op != "rect" and self.latency.get("redraw"):
+            self._input_at, self._shown = time.perf_counter(), dict(self.ui)
+
+    def _key(self, point):
+        return round(point[0], 4), round(point[1], 4)
+
+    def _holds(self, required):
+        return not required or any(
+            all(
+                self.ui.get(self.mf._affordances[name]) in allowed
+                for name, allowed in (
+                    opt.value if isinstance(opt, Options) else opt for opt in conj
+                )
+            )
+            for conj in required
+        )
+
+    def _hit(self, coords):
+        point = self._key(self._point(coords))
+        return [
+            (afford, selection)
+            for afford, selection, required in self._targets.get(point, ())
+            if self._holds(required)
+        ]
+
+    def start(self, executable_path, outport_name):
+        self.events.append(("start", executable_path, outport_name))
+        self.running = True
+
+    def stop(self):
+        self.events.append(("stop",))
+        self.running = False
+
+    def window_rect(self):
+        self._wait("rect")
+        self.events.append(("rect",))
+        return self.rect
+
+    def on_geometry_change(self, callback):
+        self._geometry_callbacks.append(callback)
+
+    def move(self, rect):
+        self.rect = rect
+        for callback in self._geometry_callbacks:
+            callback()
+
+    def _point(self, coords):
+        left, top, right, bottom = self.rect
+        return (coords[0] - left) / (right - left), (coords[1] - top) / (bottom - top)
+
+    def _menu_click(self, coords):
+        states = self.mf._states[self._menu]
+        record = self.mf._spec[self._menu][states[0]]
+        options = record["dropdown"] or {}
+        if "item_height" not in options:
+            return
+        x, y = self._point(coords)
+        scale = self.mf.B - self.mf.T
+        index = round(
+            ((y - record["point"][1]) * scale - options["offset"])
+            / options["item_height"]
+        )
+        if abs(x - record["point"][0]) < 1e-6 and 0 <= index < len(states):
+            self.ui[self._menu] = states[index]
+
+    def click(self, coords, button="left", modifier=None):
+        self._wait("click")
+        self.events.append(("click", coords))
+        if self._menu is not None:
+            self._menu_click(coords)
+            self._menu = None
+            return
+        hits = self._hit(coords)
+        if not hits:
+            return
+        afford, selection = hits[0]
+        at = type(afford).__name__
+        states = self.mf._states[afford]
+        if at == "Click_Select":
+            self.ui[afford] = selection
+        elif at == "Click_Toggle":
+            self.ui[afford] = states[1 - states.index(self.ui[afford])]
+        elif at == "Click_Cycle":
+            step = 1 if button == "left" and modifier is None else -1
+            self.ui[afford] = states[
+                (states.index(self.ui[afford]) + step) % len(states)
+            ]
+        elif at == "Click_Dropdown":
+            self._menu, self._highlight, self._typed = afford, -1, ""
+
+    def press(self, coords):
+        self._wait("click")
+        self.events.append(("press", coords))
+        for afford, _ in self._hit(coords):
+            if type(afford).__name__ == "Click_Hold_Toggle":
+                self.ui[afford] = self.mf._states[afford][0]
+
+    def release(self, coords):
+        self._wait("click")
+        self.events.append(("release", coords))
+        for afford, _ in self._hit(coords):
+            if type(afford).__name__ == "Click_Hold_Toggle":
+                self.ui[afford] = self.mf._states[afford][1]
+
+    def drag(self, start, end):
+        self._wait("click")
+        self.events.append(("drag", start, end))
+        for afford, _ in self._hit(start):
+            if type(afford).__name__ == "Click_Rel_Slider":
+                states = self.mf._states[afford]
+                # the simulated slider is drag_scale times stiffer than the uncalibrated guess
+                ppu = self.drag_scale * 200 / (len(states) - 1)
+                moved = round((start[1] - end[1]) / ppu)
+                value = min(max(self.ui[afford] + moved, states.low), states.high)
+                self.ui[afford] = value
+
+    def scroll(self, coords, ticks):
+        self._wait("wheel")
+        delay = self.latency.get("tick")
+        if delay:
+            time.sleep(delay * abs(ticks))
+        self.events.append(("wheel", coords, ticks))
+        for afford, _ in self._hit(coords):
+            if type(afford).__name__ == "Click_Rel_Slider":
+                states = self.mf._states[afford]
+                value = self.ui[afford] + ticks * self.wheel_step
+                self.ui[afford] = min(max(value, states.low), states.high)
+
+    def send_keys(self, keys):
+        self._wait("keys")
+        self.events.append(("keys", keys))
+        for name, count, char in _KEY_TOKEN.findall(keys):
+            if len(name) == 1:
+                name, char = "", name
+            for _ in range(int(count) if count.isdigit() else 1):
+                if self._menu is None:
+                    return
+                if char:
+                    self._type(char)
+                else:
+                    self._press_key(name)
+
+    def _type(self, char):
+        from minifreak import _label
+
+        self._typed += char.lower()
+        labels = [_label(s).lower() for s in self.mf._states[self._menu]]
+        self._highlight = next(
+            (i for i, l in enumerate(labels) if l.startswith(self._typed)),
+            self._highlight,
+        )
+
+    def _press_key(self, name):
+        states = self.mf._states[self._menu]
+        if name == "VK_DOWN":
+            self._highlight = min(self._highlight + 1, len(states) - 1)
+        elif name == "VK_UP":
+            self._highlight = max(self._highlight - 1, 0)
+        elif name == "ENTER":
+            if self._highlight >= 0:
+                self.ui[self._menu] = states[self._highlight]
+            self._menu = None
+        elif name == "ESC":
+            self._menu = None
+
+    def send(self, msg):
+        self._wait("midi")
+        self.events.append(("midi", msg))
+        self.messages.append(msg)
+
+    def send_many(self, msgs):
+        self._wait("midi")
+        for msg in msgs:
+            self.events.append(("midi", msg))
+            self.messages.append(msg)
+
+    def capture(self, lit=(230, 120, 20), unlit=(90, 90, 90), size=2, bar=20):
+        self._wait("capture")
+        left, top, right, bottom = self.rect
+        image = np.full((bottom - top, right - left, 3), 30, dtype=np.uint8)
+        h, w = image.shape[:2]
+        for (x, y), entries in self._targets.items():
+            shown = [
+                (
+                    self.ui.get(afford) == selection
+                    if selection is not None
+                    else getattr(self.ui.get(afford), "name", None) == "On"
+                )
+                for afford, selection, required in entries
+                if type(afford).__name__ in ("Click_Select", "Click_Toggle")
+                and self._holds(required)
+            ]
+            px, py = round(x * w), round(y * h)
+            if shown:
+                image[
+                    max(py - size, 0) : py + size + 1, max(px - size, 0) : px + size + 1
+                ] = (lit if any(shown) else unlit)
+            sliders = [
+                afford
+                for afford, _, required in entries
+                if type(afford).__name__ == "Click_Rel_Slider" and self._holds(required)
+            ]
+            for afford in sliders:
+                # relative sliders draw a value bar centered on their point
+                states = self.mf._states[afford]
+                value = (self.ui[afford] - states.low) / (states.high - states.low)
+                left = max(px - bar // 2, 0)
+                image[max(py - 1, 0) : py + 2, left : left + round(bar * value)] = lit
+        return image
+
+    def read(self, affordance):
+        # with a "redraw" latency the UI keeps showing old values after each input
+        if time.perf_counter() - self._input_at < self.latency.get("redraw", 0.0):
+            return self._shown.get(affordance)
+        return self.ui.get(affordance)
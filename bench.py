@@ -0,0 +1,318 @@
+from array import array
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from backends import Fake_Backend
+from minifreak import Dropdown_Strategy, MiniFreak
+from patches import Patch_Sampler, Patch_Scheduler
+from verify import Screen_Verifier
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    total = sum(samples)
+    return {
+        "n": len(samples),
+        "total_s": total,
+        "mean_us": 1e6 * total / len(samples) if samples else None,
+        "p50_us": 1e6 * samples[len(samples) // 2] if samples else None,
+        "p95_us": 1e6 * samples[int(0.95 * (len(samples) - 1))] if samples else None,
+        "per_s": len(samples) / total if total else None,
+    }
+
+
+def _minifreak(backend, **kwargs):
+    # no persisted caches, so runs do not depend on earlier sessions or write to the tree
+    return MiniFreak(
+        backend=backend, affordance_cache=None, slider_model_cache=None, **kwargs
+    )
+
+
+def _events(backend):
+    counts = {}
+    for event in backend.events:
+        counts[event[0]] = counts.get(event[0], 0) + 1
+    return counts
+
+
+def bench_construction(repeat, latency):
+    cold, warm = [], []
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, "affordances.cache")
+        for _ in range(repeat):
+            t = time.perf_counter()
+            MiniFreak(
+                backend=Fake_Backend(latency=latency),
+                affordance_cache=None,
+                slider_model_cache=None,
+            )
+            cold.append(time.perf_counter() - t)
+        MiniFreak(
+            backend=Fake_Backend(latency=latency),
+            affordance_cache=cache,
+            slider_model_cache=None,
+        )
+        for _ in range(repeat):
+            t = time.perf_counter()
+            MiniFreak(
+                backend=Fake_Backend(latency=latency),
+                affordance_cache=cache,
+                slider_model_cache=None,
+            )
+            warm.append(time.perf_counter() - t)
+    return {"uncached": _summary(cold), "cached": _summary(warm)}
+
+
+def bench_do(calls, latency, seed):
+    rnd = random.Random(seed)
+    mf = _minifreak(Fake_Backend(latency=latency))
+    results = {}
+    for at in mf._affordance_types:
+        affordances = [a for a in at.value if len(mf._states[a]) > 1]
+        samples = []
+        for _ in range(calls if affordances else 0):
+            affordance = rnd.choice(affordances)
+            state = rnd.choice(
+                [s for s in mf._states[affordance] if s != mf._state[affordance]]
+            )
+            if mf.plan(affordance, state) is None:
+                continue
+            mf.navigate(affordance, state)
+            t = time.perf_counter()
+            mf.do(affordance, state)
+            samples.append(time.perf_counter() - t)
+        results[at.name] = _summary(samples)
+    return results
+
+
+def bench_spec_copy(calls, seed):
+    rnd = random.Random(seed)
+    mf = _minifreak(Fake_Backend())
+    results = {}
+    for aff in mf.aff:
+        records = getattr(mf, f"_{aff.name}")
+        if not records:
+            continue
+        names = list(records)
+        samples = []
+        for _ in range(calls):
+            record = records[rnd.choice(names)]
+            t = time.perf_counter()
+            copy.deepcopy(record)
+            samples.append(time.perf_counter() - t)
+        results[aff.name] = _summary(samples)
+    affordances = list(mf._affordance_types.Midi_Slider.value)
+    samples = []
+    for i in range(calls):
+        affordance = rnd.choice(affordances)
+        states = mf._states[affordance]
+        state = states[(mf._vec[mf._order[affordance]] + 1) % len(states)]
+        t = time.perf_counter()
+        mf.do(affordance, state)
+        samples.append(time.perf_counter() - t)
+    do = _summary(samples)
+    removed = results.get("midi_slider", {}).get("mean_us")
+    return {
+        "removed_deepcopy": results,
+        "midi_slider_do": do,
+        "saved_fraction": (
+            removed / (removed + do["mean_us"]) if removed and do["mean_us"] else None
+        ),
+    }
+
+
+def bench_dropdown(calls, latency, seed):
+    results = {}
+    for strategy in (
+        Dropdown_Strategy.keys,
+        Dropdown_Strategy.batched,
+        Dropdown_Strategy.type_ahead,
+    ):
+        rnd = random.Random(seed)
+        backend = Fake_Backend(latency=latency)
+        mf = _minifreak(backend, dropdown_strategy=strategy)
+        affordances = [
+            a
+            for a in mf._affordance_types.Click_Dropdown.value
+            if len(mf._states[a]) > 1
+        ]
+        samples = []
+        for _ in range(calls):
+            affordance = rnd.choice(affordances)
+            state = rnd.choice(
+                [s for s in mf._states[affordance] if s != mf._state[affordance]]
+            )
+            if mf.plan(affordance, state) is None:
+                continue
+            mf.navigate(affordance, state)
+            t = time.perf_counter()
+            mf.do(affordance, state)
+            samples.append(time.perf_counter() - t)
+        results[strategy.name] = {
+            **_summary(samples),
+            "events": _events(backend),
+            "drift": sum(backend.ui[a] != mf.state[a] for a in backend.ui),
+        }
+    return results
+
+
+def random_patch(mf, rnd, density):
+    return {
+        a: rnd.choice(mf._states[a])
+        for a in mf._spec
+        if len(mf._states[a]) > 1 and rnd.random() < density
+    }
+
+
+def bench_sampler(patches, density, seed):
+    mf = _minifreak(Fake_Backend())
+    results = {}
+    for stratified in (False, True):
+        sampler = Patch_Sampler(mf, density, seed, stratified)
+        t = time.perf_counter()
+        vec, mask = sampler.sample(patches)
+        arrays = time.perf_counter() - t
+        t = time.perf_counter()
+        for _ in sampler.patches(patches):
+            pass
+        dicts = time.perf_counter() - t
+        coverage = sampler.coverage(vec, mask)
+        results["stratified" if stratified else "uniform"] = {
+            "arrays_per_s": patches / arrays if arrays else None,
+            "patches_per_s": patches / dicts if dicts else None,
+            "mean_coverage": sum(coverage.values()) / len(coverage),
+            "min_coverage": min(coverage.values()),
+        }
+    return results
+
+
+def bench_schedule(patches, density, latency, seed):
+    results = {}
+    for optimize in (False, True):
+        backend = Fake_Backend(latency=latency)
+        mf = _minifreak(backend)
+        snapshots = list(Patch_Sampler(mf, density, seed).snapshots(patches))
+        scheduler = Patch_Scheduler(mf)
+        t = time.perf_counter()
+        if optimize:
+            order, report = scheduler.order(snapshots)
+        else:
+            order, report = list(range(patches)), None
+        planning = time.perf_counter() - t
+        t = time.perf_counter()
+        for target in scheduler.targets(snapshots, order):
+            mf.apply(target)
+        results["ordered" if optimize else "natural"] = {
+            "planning_s": planning,
+            "apply_s": time.perf_counter() - t,
+            "estimate": report,
+            "events": _events(backend),
+        }
+    return results
+
+
+def bench_apply(patches, density, latency, seed):
+    rnd = random.Random(seed)
+    backend = Fake_Backend(latency=latency)
+    mf = _minifreak(backend)
+    targets = [random_patch(mf, rnd, density) for _ in range(patches)]
+    samples, applied, navigated, skipped = [], 0, 0, 0
+    for target in targets:
+        t = time.perf_counter()
+        report = mf.apply(target)
+        samples.append(time.perf_counter() - t)
+        applied += len(report["applied"])
+        navigated += len(report["navigated"])
+        skipped += len(report["skipped"])
+    total = sum(samples)
+    return {
+        "patches": _summary(samples),
+        "applied": applied,
+        "navigated": navigated,
+        "skipped": skipped,
+        "actions_per_s": (applied + navigated) / total if total else None,
+        "events": _events(backend),
+        "drift": sum(backend.ui[a] != mf.state[a] for a in backend.ui),
+    }
+
+
+def bench_sync(patches, density, latency, seed):
+    backend = Fake_Backend(latency=latency)
+    mf = _minifreak(backend)
+    verifier = Screen_Verifier(mf)
+    verifier.calibrate()
+    start = mf.snapshot()
+    samples, captures, navigated, unread = [], 0, 0, 0
+    for snapshot in Patch_Sampler(mf, density, seed).snapshots(patches):
+        mf.apply(mf.diff(mf.snapshot(), snapshot))
+        # forget the patch, as after a preset was loaded outside the model
+        mf._vec[:] = array("q", start)
+        t = time.perf_counter()
+        report = mf.sync(verifier)
+        samples.append(time.perf_counter() - t)
+        captures += report["captures"]
+        navigated += len(report["navigated"])
+        unread += len(report["unread"])
+    return {
+        "syncs": _summary(samples),
+        "captures_per_sync": captures / patches,
+        "navigated_per_sync": navigated / patches,
+        "unread_per_sync": unread / patches,
+        "drift": sum(backend.ui[a] != mf.state[a] for a in backend.ui),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MiniFreak automation benchmarks")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--patches", type=int, default=200)
+    parser.add_argument("--density", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--click-latency", type=float, default=0.0)
+    parser.add_argument("--keys-latency", type=float, default=0.0)
+    parser.add_argument("--midi-latency", type=float, default=0.0)
+    parser.add_argument("--rect-latency", type=float, default=0.0)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    latency = {
+        "click": args.click_latency,
+        "keys": args.keys_latency,
+        "midi": args.midi_latency,
+        "rect": args.rect_latency,
+    }
+    results = {
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "args": vars(args),
+        "construction": bench_construction(args.repeat, latency),
+        "do": bench_do(args.calls, latency, args.seed),
+        "spec_copy": bench_spec_copy(args.calls, args.seed),
+        "dropdown": bench_dropdown(args.calls, latency, args.seed),
+        "sampler": bench_sampler(100 * args.patches, args.density, args.seed),
+        "apply": bench_apply(args.patches, args.density, latency, args.seed),
+        "schedule": bench_schedule(args.patches, args.density, latency, args.seed),
+        "sync": bench_sync(
+            max(args.patches // 20, 1), args.density, latency, args.seed
+        ),
+    }
+    out = json.dumps(results, indent=2, default=str)
+    if args.out is None:
+        print(out)
+    else:
+        with open(args.out, "w") as f:
+            f.write(out)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+from collections import deque
+import threading
+import time
+
+
+class Midi_Queue:
+    def __init__(self, send, max_rate=1000.0, send_many=None):
+        self.send = send
+        self.send_many = send_many
+        self.interval = 0.0 if not max_rate else 1.0 / max_rate
+        self.sent = 0
+        self.coalesced = 0
+        self._queue = deque()
+        self._index = {}
+        self._busy = False
+        self._closed = False
+        self._error = None
+        self._next = 0.0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _key(self, msg):
+        if msg.type == "control_change":
+            return msg.type, msg.channel, msg.control
+        if msg.type == "pitchwheel" or msg.type == "aftertouch":
+            return msg.type, msg.channel
+        return None
+
+    def put(self, msg):
+        self._put(msg, self._key(msg))
+
+    def put_group(self, msgs, key=None):
+        self._put(tuple(msgs), key)
+
+    def _put(self, msg, key):
+        with self._cond:
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise RuntimeError("put: queue is closed")
+            entry = self._index.get(key) if key is not None else None
+            if entry is not None:
+                entry[1] = msg
+                self.coalesced += 1
+                return
+            entry = [key, msg]
+            self._queue.append(entry)
+            if key is None:
+                # later updates must not overtake this message
+                self._index.clear()
+            else:
+                self._index[key] = entry
+            self._cond.notify()
+
+    def put_many(self, msgs):
+        for msg in msgs:
+            self.put(msg)
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue)
+
+    def flush(self, timeout=None):
+        with self._cond:
+            done = self._cond.wait_for(
+                lambda: self._error is not None or not (self._queue or self._busy),
+                timeout=timeout,
+            )
+            if self._error is not None:
+                raise self._error
+            return done
+
+    def close(self, flush=True):
+        try:
+            if flush:
+                self.flush()
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                entry = self._queue.popleft()
+                key, msg = entry
+                if key is not None and self._index.get(key) is entry:
+                    del self._index[key]
+                self._busy = True
+            delay = self._next - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                if not isinstance(msg, tuple):
+                    self.send(msg)
+                elif self.send_many is not None:
+                    self.send_many(msg)
+                else:
+                    for m in msg:
+                        self.send(m)
+            except Exception as e:
+                # the port is gone; pending messages are dropped and callers see the error
+                with self._cond:
+                    self._error = e
+                    self._queue.clear()
+                    self._index.clear()
+                    self._busy = False
+                    self._cond.notify_all()
+                return
+            self._next = max(self._next, time.perf_counter() - self.interval)
+            self._next += self.interval
+            with self._cond:
+                self.sent += 1
+                self._busy = False
+                self._cond.notify_all()
@@ -1,16 +1,58 @@
-from collections import defaultdict
-import copy
+from array import array
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import Mapping
 from enum import Enum
-import itertools
+import fnmatch
+import gc
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import pickle
+import time
 from typing import List, Optional, Tuple, Union
 
-from pywinauto import Application, mouse, keyboard
 import mido
-import pywinauto
+import numpy as np
 
+from backends import Backend, Pywinauto_Backend
+from midi import Midi_Queue
 from options import *
+from settle import Settle_Estimator
 import options
 
+AFFORDANCE_CACHE_VERSION = 2
+AFFORDANCE_CACHE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".affordances.cache"
+)
+SLIDER_MODEL_CACHE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".slider_model.cache"
+)
+
+# Click_Rel_Slider: (pattern, (low, high, default)) in displayed integer units;
+# defaults are assumed until read back from the plugin
+REL_SLIDER_RANGES = (
+    ("*_curve_settings_*", (-100, 100, 0)),
+    ("vel_*_settings_envelope", (0, 100, 0)),
+    ("vibrato_*_settings_wheels", (0, 100, 0)),
+    ("bend_range_settings_wheels", (1, 12, 2)),
+    ("uni_count_settings_uni_voice", (2, 6, 2)),
+    ("uni_spread_settings_uni_voice", (0, 100, 0)),
+    ("amount_*_macro_*", (-100, 100, 0)),
+    ("brightness", (0, 100, 50)),
+    ("timbre", (0, 100, 50)),
+    ("grid_length_lfo_shaper_*", (2, 16, 16)),
+    ("amplitude_lfo_shaper_*", (0, 100, 100)),
+    ("swing_seq", (50, 75, 50)),
+    ("tempo_seq", (30, 240, 120)),
+    ("mod_*_matrix", (-100, 100, 0)),
+)
+# pixels assumed to sweep a relative slider's range until calibrate_sliders() has run
+DRAG_PIXELS = 200
+
+# plans are keyed by mode values too, so the table is bounded as an LRU
+PLAN_CACHE_SIZE = 4096
+
 
 # Midi_*: values are control numbers
 class Mf_Midi_Slider(Enum):
@@ -56,6 +98,27 @@ class Mf_Midi_Slider(Enum):
     macro_2 = 118
 
 
+# 14-bit paths: ("cc14", lsb_control) or ("nrpn", parameter_msb, parameter_lsb);
+# none is confirmed for the MiniFreak V yet, so each slider is opted in explicitly
+# with hires={Mf_Midi_Slider.<name>: path} until it is listed here
+HIRES_PATHS = {}
+
+
+# seconds the plugin needs to reflect a change, by affordance type
+SETTLE_LATENCIES = {
+    "Midi_Disc_Toggle": 0.0,
+    "Midi_Cont_Toggle": 0.005,
+    "Midi_Slider": 0.005,
+    "Click_Select": 0.05,
+    "Click_Toggle": 0.03,
+    "Click_Hold_Toggle": 0.03,
+    "Click_Refresh": 0.05,
+    "Click_Cycle": 0.03,
+    "Click_Dropdown": 0.1,
+    "Click_Rel_Slider": 0.03,
+}
+
+
 class Mf_Midi_Cont_Toggle(Enum):
     hold = 64
 
@@ -89,6 +152,130 @@ class Def_Afford(Enum):
         return aff in cls and not cls.is_programmatic(aff)
 
 
+# click_select affordances over these selections only change what is shown
+_VIEW_SELECTIONS = (
+    primary_tabs,
+    fx_tabs,
+    chord_scale_tabs,
+    panel,
+    secondary_tabs,
+    lfo_tabs,
+    routing_slot_adv,
+    routing_slot_seq,
+    scroll_positions,
+)
+
+
+class Float_Domain:
+    def __init__(self, levels):
+        self.levels = levels
+
+    def __len__(self):
+        return self.levels
+
+    def __getitem__(self, i):
+        if not -self.levels <= i < self.levels:
+            raise IndexError(i)
+        return (i % self.levels) / (self.levels - 1)
+
+    def __iter__(self):
+        return (self[i] for i in range(self.levels))
+
+    def __contains__(self, x):
+        return isinstance(x, (int, float)) and 0.0 <= x <= 1.0
+
+    def __eq__(self, other):
+        return isinstance(other, Float_Domain) and other.levels == self.levels
+
+    def __hash__(self):
+        return hash((Float_Domain, self.levels))
+
+    def __repr__(self):
+        return f"Float_Domain({self.levels})"
+
+    def index(self, x):
+        if x not in self:
+            raise ValueError(f"{x} is not in {self}")
+        return round(x * (self.levels - 1))
+
+
+class Range_Domain:
+    def __init__(self, low, high):
+        self.low, self.high = low, high
+
+    def __len__(self):
+        return self.high - self.low + 1
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        return self.low + i % len(self)
+
+    def __iter__(self):
+        return iter(range(self.low, self.high + 1))
+
+    def __contains__(self, x):
+        return isinstance(x, (int, float)) and self.low <= x <= self.high
+
+    def __eq__(self, other):
+        return isinstance(other, Range_Domain) and (other.low, other.high) == (
+            self.low,
+            self.high,
+        )
+
+    def __hash__(self):
+        return hash((Range_Domain, self.low, self.high))
+
+    def __repr__(self):
+        return f"Range_Domain({self.low}, {self.high})"
+
+    def index(self, x):
+        if x not in self:
+            raise ValueError(f"{x} is not in {self}")
+        return round(x) - self.low
+
+
+def _rel_slider_range(name):
+    for pattern, bounds in REL_SLIDER_RANGES:
+        if fnmatch.fnmatchcase(name, pattern):
+            return bounds
+    raise ValueError(f"_rel_slider_range: {name}: no range registered")
+
+
+class Frozen_Dict(dict):
+    def _immutable(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__}: records are read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return Frozen_Dict, (dict(self),)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return Frozen_Dict({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class State_View(Mapping):
+    def __init__(self, mf):
+        self._mf = mf
+
+    def __getitem__(self, affordance):
+        mf = self._mf
+        return mf._states[affordance][mf._vec[mf._order[affordance]]]
+
+    def __iter__(self):
+        return iter(self._mf._layout)
+
+    def __len__(self):
+        return len(self._mf._layout)
+
+
 class Toggle_State(Enum):
     On = auto()
     Off = auto()
@@ -99,6 +286,77 @@ class Hold_Toggle_State(Enum):
     Released = auto()
 
 
+# keys: one keystroke per item, batched: a single send_keys string,
+# type_ahead: shortest unique label prefix, click: computed menu item position
+class Dropdown_Strategy(Enum):
+    keys = auto()
+    batched = auto()
+    type_ahead = auto()
+    click = auto()
+
+
+# slider_strategy: one strategy for all, or {slider name: strategy}; sliders left
+# out pick from measured cost, which needs a value readback, and drag otherwise
+class Slider_Strategy(Enum):
+    drag = auto()
+    wheel = auto()
+
+
+def _requirement(opt):
+    return opt.value if isinstance(opt, Options) else opt
+
+
+def _holds(compiled, vec):
+    for conj in compiled:
+        for i, mask in conj:
+            if not mask >> vec[i] & 1:
+                break
+        else:
+            return True
+    return False
+
+
+def _compile(required, positions, ordinals):
+    conjs = []
+    for conj in required or [[]]:
+        checks = []
+        for opt in conj:
+            name, allowed = _requirement(opt)
+            i = positions[name]
+            mask = sum(1 << ordinals[i][s] for s in allowed if s in ordinals[i])
+            checks.append((i, mask))
+        conjs.append(tuple(checks))
+    return tuple(conjs)
+
+
+def _label(selection):
+    name = selection.name
+    for token, char in (
+        ("__slash__", "/"),
+        ("__dash__", "-"),
+        ("__period__", "."),
+        ("_plus__", "+"),
+        ("_minus__", "-"),
+    ):
+        name = name.replace(token, char)
+    return name.replace("_", " ").strip()
+
+
+def _type_ahead(labels, choice):
+    labels = [label.lower() for label in labels]
+    target = labels[choice]
+    for k in range(1, len(target) + 1):
+        prefix = target[:k]
+        if next(i for i, l in enumerate(labels) if l.startswith(prefix)) == choice:
+            return prefix
+    # an earlier label extends this one, so typing cannot reach it
+    return None
+
+
+def _escape_keys(text):
+    return "".join(f"{{{c}}}" if c in "+^%~(){}[]" else c for c in text)
+
+
 class MiniFreak:
 
     def __init__(
@@ -110,8 +368,40 @@ class MiniFreak:
         R=1946,
         B=1318,
         affordances=Def_Afford,
+        affordance_cache=AFFORDANCE_CACHE,
+        backend=None,
+        rect_revalidate_every=None,
+        cycle_retries=1,
+        dropdown_strategy=None,
+        midi_rate=None,
+        hires=None,
+        settle=None,
+        adaptive_settle=False,
+        poll_interval=0.002,
+        slider_model_cache=SLIDER_MODEL_CACHE,
+        slider_strategy=None,
+        screen_readback=False,
     ):
-        self.app = Application()
+        self.backend = Pywinauto_Backend() if backend is None else backend
+        self.rect_revalidate_every = rect_revalidate_every
+        self._rect, self._rect_clicks = None, 0
+        self.cycle_retries = cycle_retries
+        self.midi_rate = midi_rate
+        self.midi_queue = None
+        self.settle = {**SETTLE_LATENCIES, **(settle or {})}
+        self.settler = Settle_Estimator(self.settle)
+        self.adaptive_settle = adaptive_settle
+        self.poll_interval = poll_interval
+        self.verifier = None
+        # controls whose modelled value is a guess: sliders set without readback
+        # and controls sync() could not read
+        self.unverified = set()
+        self._executor = None
+        self.dropdown_strategy = (
+            Dropdown_Strategy.batched
+            if dropdown_strategy is None
+            else dropdown_strategy
+        )
         self.executable_path = executable_path
         self.outport_name = outport_name
         self.aff = affordances
@@ -119,6 +409,43 @@ class MiniFreak:
         self.T = T
         self.R = R
         self.B = B
+        self.affordance_cache = affordance_cache
+        if hires is True:
+            if not HIRES_PATHS:
+                raise ValueError(
+                    "MiniFreak: hires=True: no 14-bit path is confirmed; pass {slider: path}"
+                )
+            hires = HIRES_PATHS
+        self._hires_paths = {s.name: path for s, path in (hires or {}).items()}
+        self.slider_model_cache = slider_model_cache
+        self.slider_strategy = slider_strategy
+        self._slider_model = self._load_slider_model()
+        tables = self._load_affordances()
+        if tables is None:
+            self._add_affordances()
+            tables = self._build_tables()
+            self._save_affordances(tables)
+        self._bind_tables(tables)
+        if isinstance(slider_strategy, dict):
+            sliders = {a.name for a in self._affordance_types.Click_Rel_Slider.value}
+            unknown = sorted(set(slider_strategy) - sliders)
+            if unknown:
+                raise ValueError(
+                    f"MiniFreak: slider_strategy: not relative sliders: {unknown}"
+                )
+        self.backend.attach(self)
+        self.backend.on_geometry_change(self.invalidate_geometry)
+        if screen_readback:
+            from verify import Screen_Verifier
+
+            # must be calibrated once the plugin shows the modelled state
+            self.verifier = Screen_Verifier(self)
+        if adaptive_settle and not self.can_read():
+            raise ValueError(
+                "MiniFreak: adaptive_settle needs a backend with read() or screen_readback=True"
+            )
+
+    def _add_affordances(self):
         self.n_affordances = 0
         for elt in Mf_Midi_Cont_Toggle:
             self._add_programmatic_affordance(self.aff.midi_cont_toggle, elt)
@@ -1250,7 +1577,7 @@ class MiniFreak:
         for i in range(13):
             x = 1088 + i * ((1764 - 1088) / 12)
             for j in range(7):
-                y = 1045 + i * ((1231 - 1045) / 6)
+                y = 1045 + j * ((1231 - 1045) / 6)
                 self._add_ui_affordance(
                     self.aff.click_rel_slider,
                     name=f"mod_{i}_{j}_matrix",
@@ -1275,6 +1602,65 @@ class MiniFreak:
         #                     (734 , 969 ),
         #                     None)
 
+    def _cache_key(self):
+        digest = hashlib.sha256(str(AFFORDANCE_CACHE_VERSION).encode())
+        for module in (__file__, options.__file__):
+            with open(module, "rb") as f:
+                digest.update(f.read())
+        digest.update(
+            repr(
+                (
+                    self.L,
+                    self.T,
+                    self.R,
+                    self.B,
+                    [a.name for a in self.aff],
+                    sorted(self._hires_paths),
+                )
+            ).encode()
+        )
+        return digest.hexdigest()
+
+    def _load_affordances(self):
+        if self.affordance_cache is None:
+            return None
+        # the tables are thousands of small containers; collection passes only slow the load
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(self.affordance_cache, "rb") as f:
+                cached = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        finally:
+            if enabled:
+                gc.enable()
+        if (
+            cached.get("version") != AFFORDANCE_CACHE_VERSION
+            or cached.get("key") != self._cache_key()
+        ):
+            return None
+        self.n_affordances = cached["n_affordances"]
+        return cached["tables"]
+
+    def _save_affordances(self, tables):
+        if self.affordance_cache is None:
+            return
+        cached = {
+            "version": AFFORDANCE_CACHE_VERSION,
+            "key": self._cache_key(),
+            "n_affordances": self.n_affordances,
+            "tables": tables,
+        }
+        tmp = f"{self.affordance_cache}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.affordance_cache)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
     def _add_programmatic_affordance(self, afford, cc: Enum, **kwargs):
         if not hasattr(self, f"_{afford.name}"):
             setattr(self, f"_{afford.name}", {})
@@ -1284,7 +1670,7 @@ class MiniFreak:
             kwargs.update(control=cc.value)
             self._midi_slider[cc.name] = kwargs
         elif afford is self.aff.midi_cont_toggle:
-            self._midi_cont_toggle[cc] = {
+            self._midi_cont_toggle[cc.name] = {
                 "control": cc.value,
             }
 
@@ -1310,6 +1696,8 @@ class MiniFreak:
             List[Tuple[List[Options], List[Options]]],
         ] = [],
         name: Optional[str] = None,
+        reverse: Optional[dict] = None,
+        dropdown: Optional[dict] = None,
         _processed: bool = False,
     ):
         if selections is not None and name is None:
@@ -1350,27 +1738,25 @@ class MiniFreak:
         if not _processed and not hasattr(self, f"_{aff.name}"):
             setattr(self, f"_{aff.name}", defaultdict(lambda: defaultdict(dict)))
 
-        for i, r in enumerate(required):
-            if isinstance(r, tuple):
-                required, branch = r
-            else:
-                required, branch = r, None
-            if branch is not None and branch:
-                sub_name, leaves = branch[0].value
-                for leaf in leaves:
-                    new_required = required + [(sub_name, frozenset((leaf,)))]
-                    r_new = (
-                        (new_required, branch[1:]) if len(branch) > 1 else new_required
-                    )
-                    self._add_ui_affordance(
-                        aff,
-                        name=f"{name}_{leaf.name}",
-                        selections=selections,
-                        points=points,
-                        required=(required[:i] + [r_new] + required[i + 1 :]),
-                        _processed=True,
-                    )
-                return
+        branched = [r for r in required if isinstance(r, tuple) and r[1]]
+        plain = [r for r in required if not (isinstance(r, tuple) and r[1])]
+        for conj, branch in branched:
+            sub_name, leaves = branch[0].value
+            for leaf in sorted(leaves, key=lambda leaf: leaf.value):
+                new_required = conj + [(sub_name, frozenset((leaf,)))]
+                r_new = (new_required, branch[1:]) if len(branch) > 1 else new_required
+                self._add_ui_affordance(
+                    aff,
+                    name=f"{name}_{leaf.name}",
+                    selections=selections,
+                    points=points,
+                    required=plain + [r_new],
+                    reverse=reverse,
+                    dropdown=dropdown,
+                    _processed=True,
+                )
+        if branched:
+            return
 
         records = getattr(self, f"_{aff.name}")
 
@@ -1384,183 +1770,1091 @@ class MiniFreak:
             or aff is self.aff.click_rel_slider
         ):
             records[name][points[0]] = required
-        elif aff is self.aff.click_cycle or aff is self.aff.click_dropdown:
+        elif aff is self.aff.click_cycle:
             for selection in selections:
-                records[name][selection] = {"point": points[0], "required": required}
+                records[name][selection] = {
+                    "point": points[0],
+                    "required": required,
+                    "reverse": reverse,
+                }
+        elif aff is self.aff.click_dropdown:
+            for selection in selections:
+                records[name][selection] = {
+                    "point": points[0],
+                    "required": required,
+                    "dropdown": dropdown,
+                }
 
         self.n_affordances += 1
 
-    def _finalize_affordances(self):
-        affordance_types, self._spec, self._state, self._states = {}, {}, {}, {}
+    def _build_tables(self, validate=True):
+        # everything except the runtime Enums, by layout position, so it can be cached
+        types, names, specs, states, initial = [], [], [], [], []
+        programmatic, views = set(), set()
         for aff in self.aff:
             affordance_type = "_".join(
                 map(lambda s: s.capitalize(), aff.name.split("_"))
             )
             records = getattr(self, f"_{aff.name}")
-            affordances = Enum(affordance_type, tuple(records.keys()))
-            affordance_types[affordance_type] = affordances
-            for afford in affordances:
-                spec = records[afford.name]
-                self._spec[afford] = spec
+            types.append((affordance_type, tuple(records)))
+            for name, record in records.items():
+                i = len(specs)
+                spec = _freeze(record)
+                specs.append(spec)
+                names.append(name)
+                if self.aff.is_programmatic(aff):
+                    programmatic.add(i)
                 if aff is self.aff.midi_disc_toggle or aff is self.aff.midi_cont_toggle:
-                    self._state[afford] = Toggle_State.Off
-                    self._states[afford] = tuple(Toggle_State)
+                    init, domain = Toggle_State.Off, tuple(Toggle_State)
+                elif aff is self.aff.midi_slider and name in self._hires_paths:
+                    init, domain = 0.0, Float_Domain(1 << 14)
                 elif aff is self.aff.midi_slider:
-                    self._state[afford] = 0
-                    self._states[afford] = tuple(range(128))
+                    init, domain = 0, tuple(range(128))
                 elif aff is self.aff.click_select:
-                    self._states[afford] = tuple(spec.keys())
-                    self._state[afford] = self._states[afford][0]
+                    domain = tuple(spec.keys())
+                    init = domain[0]
+                    if type(init) in _VIEW_SELECTIONS:
+                        views.add(i)
                 elif aff is self.aff.click_toggle:
-                    self._state[afford] = Toggle_State.Off
-                    self._states[afford] = tuple(Toggle_State)
+                    init, domain = Toggle_State.Off, tuple(Toggle_State)
                 elif aff is self.aff.click_hold_toggle:
-                    self._state[afford] = Hold_Toggle_State.Released
-                    self._states[afford] = tuple(Hold_Toggle_State)
+                    init, domain = Hold_Toggle_State.Released, tuple(Hold_Toggle_State)
                 elif aff is self.aff.click_refresh:  # TODO: revisit
-                    self._state[afford] = None
-                    self._states[afford] = (None,)
+                    init, domain = None, (None,)
                 elif aff is self.aff.click_cycle or aff is self.aff.click_dropdown:
-                    self._states[afford] = tuple(spec.keys())
-                    self._state[afford] = self._states[afford][0]
-                elif aff is self.aff.click_rel_slider:  # TODO: revisit
-                    self._state[afford] = None
-                    self._states[afford] = (None,)
+                    domain = tuple(spec.keys())
+                    init = domain[0]
+                elif aff is self.aff.click_rel_slider:
+                    low, high, init = _rel_slider_range(name)
+                    domain = Range_Domain(low, high)
+                states.append(domain)
+                initial.append(domain.index(init))
+
+        positions = {name: i for i, name in enumerate(names)}
+        if validate:
+            for i, spec in enumerate(specs):
+                for key, record in spec.items():
+                    required = (
+                        record["required"] if isinstance(record, dict) else record
+                    )
+                    if not isinstance(required, (list, tuple)):
+                        continue
+                    for opts in required:
+                        for opt in opts:
+                            assert (
+                                _requirement(opt)[0] in positions
+                            ), f"invalid requirement specification: {names[i]}: {key}: {required}"
 
+        ordinals = [
+            (
+                None
+                if isinstance(domain, (Float_Domain, Range_Domain))
+                else {s: k for k, s in enumerate(domain)}
+            )
+            for domain in states
+        ]
+
+        def compile(required):
+            return _compile(required, positions, ordinals)
+
+        checks = {
+            i: {
+                key: compile(record["required"] if isinstance(record, dict) else record)
+                for key, record in spec.items()
+            }
+            for i, spec in enumerate(specs)
+            if i not in programmatic
+        }
+        # controls without per-state records are reachable wherever any of their points is
+        unions = {
+            i: tuple(conj for required in spec.values() for conj in required)
+            for i, spec in enumerate(specs)
+            if i not in programmatic
+            and not any(isinstance(record, dict) for record in spec.values())
+        }
+        return {
+            "types": types,
+            "specs": specs,
+            "states": states,
+            "ordinals": ordinals,
+            "initial": initial,
+            "programmatic": programmatic,
+            "views": views,
+            "checks": checks,
+            "unions": unions,
+            "union_checks": {i: compile(u) for i, u in unions.items()},
+        }
+
+    def _bind_tables(self, tables):
         self._affordance_types = Enum(
-            "Affordance_Types", {e.name: e for e in affordance_types}
-        )
-        self._affordances = {
-            a.name: a for at in self._affordance_types for a in at.value
+            "Affordance_Types",
+            {name: Enum(name, members) for name, members in tables["types"]},
+        )
+        layout = tuple(a for at in self._affordance_types for a in at.value)
+        self._layout = layout
+        self._affordances = {a.name: a for a in layout}
+        self._order = {a: i for i, a in enumerate(layout)}
+        self._spec = dict(zip(layout, tables["specs"]))
+        self._states = dict(zip(layout, tables["states"]))
+        self._ordinals = {
+            a: ordinals
+            for a, ordinals in zip(layout, tables["ordinals"])
+            if ordinals is not None
         }
+        self._programmatic = {layout[i] for i in tables["programmatic"]}
+        self._views = {layout[i] for i in tables["views"]}
+        self._checks = {layout[i]: checks for i, checks in tables["checks"].items()}
+        self._unions = {layout[i]: u for i, u in tables["unions"].items()}
+        self._union_checks = {layout[i]: c for i, c in tables["union_checks"].items()}
+        self._plans, self._scopes = OrderedDict(), {}
+        self._vec = array("q", tables["initial"])
+        self._state = State_View(self)
 
-        for afford in affordance_types[affordance_type]:
-            elt = self._spec[afford]
-            for afford in affordance_types[affordance_type]:
-                if (
-                    aff is self.aff.click_select
-                    or aff is self.aff.click_cycle
-                    or aff is self.aff.click_dropdown
-                ):
-                    for s, d in elt.items():
-                        for opts in d["required"]:
-                            for opt in opts:
-                                assert (
-                                    opt.value[0] in self._affordances
-                                ), f"invalid requirement specification: {afford}: {s}: {d['required']}"
-                elif (
-                    aff is self.aff.click_toggle
-                    or aff is self.aff.click_hold_toggle
-                    or aff is self.aff.click_refresh
-                    or aff is self.aff.click_rel_slider
-                ):
-                    for point, required in elt.items():
-                        for opts in required:
-                            for opt in opts:
-                                assert (
-                                    opt.value[0] in self._affordances
-                                ), f"invalid requirement specification: {afford}: {point}: {d['required']}"
+    def _ordinal(self, affordance, state):
+        ordinals = self._ordinals.get(affordance)
+        if ordinals is None:
+            return self._states[affordance].index(state)
+        return ordinals[state]
+
+    def _set(self, affordance, ordinal):
+        self._vec[self._order[affordance]] = ordinal
 
     @property
     def state(self):
         return self._state
 
+    @property
+    def app(self):
+        # the pywinauto Application moved to Pywinauto_Backend with the backend split
+        return self.backend.app
+
+    def snapshot(self, target=None):
+        if target is None:
+            return self._vec.tobytes()
+        vec = array("q", self._vec)
+        for affordance, state in target.items():
+            vec[self._order[affordance]] = self._ordinal(affordance, state)
+        return vec.tobytes()
+
+    def decode(self, snapshot):
+        vec = np.frombuffer(snapshot, dtype=np.int64)
+        return {a: self._states[a][int(o)] for a, o in zip(self._layout, vec)}
+
+    def diff(self, old, new=None):
+        old = np.frombuffer(old, dtype=np.int64)
+        new = np.frombuffer(self._vec if new is None else new, dtype=np.int64)
+        return {
+            self._layout[i]: self._states[self._layout[i]][int(new[i])]
+            for i in np.flatnonzero(old != new)
+        }
+
+    def patch_from_snapshot(self, snapshot):
+        # views are where the GUI happens to be, not part of the patch, so applying
+        # the result leaves the current tabs alone
+        return {
+            a: s
+            for a, s in self.diff(self.snapshot(), snapshot).items()
+            if a not in self._views
+        }
+
+    def fingerprint(self, snapshot=None):
+        return hashlib.blake2b(
+            self._vec if snapshot is None else snapshot, digest_size=16
+        ).hexdigest()
+
     def __enter__(self):
-        self.app.start(self.executable_path)
-        self._outport = mido.open_output(self.outport_name)
+        self.backend.start(self.executable_path, self.outport_name)
+        self.invalidate_geometry()
+        if self.midi_rate is not None:
+            self.midi_queue = Midi_Queue(
+                self.backend.send, self.midi_rate, self.backend.send_many
+            )
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.app.kill()
-        self._outport.close()
+        try:
+            if self.midi_queue is not None:
+                queue, self.midi_queue = self.midi_queue, None
+                queue.close()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            self.save_slider_model()
+            self.backend.stop()
         return False
 
-    def do(self, affordance, state, **kwargs):
+    def do(self, affordance, state, navigate=False, **kwargs):
         states = self._states[affordance]
-        spec = copy.deepcopy(self._spec[affordance])
+        spec = self._spec[affordance]
         if state not in states:
             raise ValueError(
                 f"do: {affordance}: {state}: requested state not among valid states: {states}"
             )
-        choice, curr = states.index(state), states.index(self._state[affordance])
-        if choice == curr:
-            return
-        at = self._affordance_types[affordance.__name__]
+        at = self._affordance_types[type(affordance).__name__]
+        # stepping or flipping a guessed value would only move it to another guess
+        relative = at.name in ("Click_Toggle", "Click_Hold_Toggle", "Click_Cycle")
+        choice = self._ordinal(affordance, state)
+        if choice == self._vec[self._order[affordance]] and (
+            relative or affordance not in self.unverified
+        ):
+            return False
+        checks = self._checks.get(affordance)
+        if navigate and affordance not in self._programmatic:
+            self.navigate(affordance, state)
+        if kwargs and affordance in self._programmatic:
+            spec = {**spec, **kwargs}
         if at is self._affordance_types.Midi_Disc_Toggle:
-            spec.update(kwargs)
             if state is Toggle_State.On:
                 self._send(f"{affordance.name}_on", **spec)
             elif state is Toggle_State.Off:
                 self._send(f"{affordance.name}_off", **spec)
         if at is self._affordance_types.Midi_Cont_Toggle:
-            spec.update(kwargs)
             if state is Toggle_State.On:
                 self._send("control_change", value=127, **spec)
             if state is Toggle_State.Off:
                 self._send("control_change", value=0, **spec)
         if at is self._affordance_types.Midi_Slider:
-            self._send("control_change", value=state, **spec)
+            path = self._hires_paths.get(affordance.name)
+            if path is None:
+                self._send("control_change", value=state, **spec)
+            else:
+                self._send_group(
+                    self._hires_messages(spec["control"], path, choice),
+                    ("hires", affordance.name),
+                )
         if at is self._affordance_types.Click_Select:
-            if self._satisfied(spec[state]["required"]):
-                self._click(spec[state]["point"])
+            if not _holds(checks[state], self._vec):
+                return False
+            self._click(spec[state]["point"])
         if at is self._affordance_types.Click_Toggle:
-            for point, required in spec.items():
-                if self._satisfied(required):
-                    self._click(point)
+            points = [
+                point for point, check in checks.items() if _holds(check, self._vec)
+            ]
+            if not points:
+                return False
+            for point in points:
+                self._click(point)
         if at is self._affordance_types.Click_Hold_Toggle:
-            for point, required in spec.items():
-                if self._satisfied(required):
-                    if state is Hold_Toggle_State.Released:
-                        self._hold_click(point)
-                    elif state is Hold_Toggle_State.Held:
-                        self._release_click(point)
+            points = [
+                point for point, check in checks.items() if _holds(check, self._vec)
+            ]
+            if not points:
+                return False
+            for point in points:
+                if state is Hold_Toggle_State.Held:
+                    self._hold_click(point)
+                elif state is Hold_Toggle_State.Released:
+                    self._release_click(point)
         if at is self._affordance_types.Click_Refresh:
-            for point, required in spec.items():
-                if self._satisfied(required):
-                    self._click(point)
+            points = [
+                point for point, check in checks.items() if _holds(check, self._vec)
+            ]
+            if not points:
+                return False
+            for point in points:
+                self._click(point)
         if at is self._affordance_types.Click_Cycle:
-            if self._satisfied(spec[state]["required"]):
-                if choice < curr:
-                    for _ in itertools.chain(states[curr:], states[:choice]):
-                        self._click(spec[state]["point"])
-                else:
-                    for _ in states[curr:choice]:
-                        self._click(spec[state]["point"])
+            if not _holds(checks[state], self._vec):
+                return False
+            done = self._cycle(affordance, state, spec[state])
+            if done is False:
+                return False
+            if done:
+                self.unverified.discard(affordance)
         if at is self._affordance_types.Click_Dropdown:
-            if self._satisfied(spec[state]["required"]):
-                self._click(spec[state]["point"])
-                for _ in range(choice + 1):
-                    self._kbd_down()
-                self._kbd_enter()
+            if not _holds(checks[state], self._vec):
+                return False
+            self._dropdown(affordance, state, spec[state])
         if at is self._affordance_types.Click_Rel_Slider:
-            pass
-
-    def _satisfied(self, req):
-        return any(
-            req,
-            lambda r: all(
-                r,
-                lambda opt: self.state[self._affordances[opt.value[0]]] in opt.value[1],
-            ),
+            points = [
+                point for point, check in checks.items() if _holds(check, self._vec)
+            ]
+            if not points:
+                return False
+            done = self._slide(affordance, state, points[0])
+            if done is False:
+                return False
+            if done is None:
+                self.unverified.add(affordance)
+            else:
+                self.unverified.discard(affordance)
+        if (
+            self.adaptive_settle
+            and at is not self._affordance_types.Click_Cycle
+            and at is not self._affordance_types.Click_Rel_Slider
+            and affordance not in self._programmatic
+            and not self._settled(affordance, state)
+        ):
+            return False
+        if not relative and at is not self._affordance_types.Click_Rel_Slider:
+            self.unverified.discard(affordance)
+        self._set(affordance, choice)
+        return True
+
+    def can_read(self):
+        return type(self.backend).read is not Backend.read or self.verifier is not None
+
+    def _read(self, affordance):
+        observed = self.backend.read(affordance)
+        if (
+            observed is None
+            and self.verifier is not None
+            and type(affordance).__name__ in ("Click_Select", "Click_Toggle")
+        ):
+            observed = self.verifier.read(affordance)
+        return observed
+
+    def _poll(self, affordance, state):
+        kind = type(affordance).__name__
+        start = time.perf_counter()
+        observed = self._read(affordance)
+        if observed is None:
+            time.sleep(self.settler.delay(kind))
+            return None
+        deadline = start + self.settler.timeout(kind)
+        while observed != state:
+            if time.perf_counter() >= deadline:
+                self.settler.timed_out(kind)
+                return observed
+            time.sleep(self.poll_interval)
+            observed = self._read(affordance)
+        self.settler.observe(kind, time.perf_counter() - start)
+        return observed
+
+    def _settled(self, affordance, state):
+        observed = self._poll(affordance, state)
+        if observed is None or observed == state:
+            return True
+        # fallback: one more look after a full estimated delay before giving up
+        time.sleep(self.settler.delay(type(affordance).__name__))
+        observed = self._read(affordance)
+        if observed == state:
+            return True
+        if observed in self._states[affordance]:
+            self._set(affordance, self._ordinal(affordance, observed))
+        return False
+
+    def _cycle(self, affordance, state, record):
+        states = self._states[affordance]
+        choice, curr = (
+            self._ordinal(affordance, state),
+            self._vec[self._order[affordance]],
+        )
+        for _ in range(self.cycle_retries + 1):
+            forward = (choice - curr) % len(states)
+            backward = (curr - choice) % len(states)
+            if record["reverse"] is not None and backward < forward:
+                for _ in range(backward):
+                    self._click(record["point"], **record["reverse"])
+            else:
+                for _ in range(forward):
+                    self._click(record["point"])
+            if self.adaptive_settle:
+                observed = self._poll(affordance, state)
+            else:
+                observed = self._read(affordance)
+            if observed is None:
+                return None
+            if observed == state:
+                return True
+            curr = self._ordinal(affordance, observed)
+        self._set(affordance, curr)
+        return False
+
+    def _per_unit(self, kind, affordance):
+        models = self._slider_model[kind]
+        size = len(self._states[affordance]) - 1
+        if affordance.name in models:
+            actuation, moved = models[affordance.name]
+            return actuation / moved
+        # uncalibrated sliders start from what the others learned:
+        # drag pixels per full sweep, wheel ticks per unit
+        actuation = moved = 0.0
+        for name, (a, m) in models.items():
+            other = self._affordances.get(name)
+            if other is not None and isinstance(self._states[other], Range_Domain):
+                actuation += a
+                moved += m / (len(self._states[other]) - 1) if kind == "drag" else m
+        if not moved:
+            return DRAG_PIXELS / size if kind == "drag" else 1.0
+        return actuation / moved / (size if kind == "drag" else 1)
+
+    def _learn(self, kind, affordance, actuation, moved):
+        # ratio of sums averages out rounding; halving keeps it adaptive
+        total, total_moved = self._slider_model[kind].get(affordance.name, (0.0, 0.0))
+        total, total_moved = total + abs(actuation), total_moved + abs(moved)
+        if total_moved > 16 * len(self._states[affordance]):
+            total, total_moved = total / 2, total_moved / 2
+        self._slider_model[kind][affordance.name] = (total, total_moved)
+
+    def _mean_cost(self, affordance, strategy):
+        costs = self._slider_model["cost"]
+        n, total, misses = costs.get((affordance.name, strategy.name), (0, 0.0, 0))
+        if n < 2:
+            # borrow from sliders with the same range until this one has samples
+            size = len(self._states[affordance])
+            for (name, kind), (m, t, x) in costs.items():
+                other = self._affordances.get(name)
+                if (
+                    kind == strategy.name
+                    and other is not None
+                    and other is not affordance
+                ):
+                    if len(self._states[other]) == size:
+                        n, total, misses = n + m, total + t, misses + x
+        # expected time per exact setting: a miss costs a whole extra attempt
+        return total / max(n - misses, 0.5) if n else None
+
+    def _configured_strategy(self, affordance):
+        if isinstance(self.slider_strategy, dict):
+            return self.slider_strategy.get(affordance.name)
+        return self.slider_strategy
+
+    def _slider_strategy_for(self, affordance):
+        strategy = self._configured_strategy(affordance)
+        if strategy is not None:
+            return strategy
+        if type(self.backend).read is Backend.read:
+            # without a readback no outcome is measured, so there is nothing to choose by
+            return Slider_Strategy.drag
+        means = {s: self._mean_cost(affordance, s) for s in Slider_Strategy}
+        for strategy, mean in means.items():
+            if mean is None:
+                return strategy
+        return min(means, key=means.get)
+
+    def _slide(self, affordance, state, point):
+        strategy = self._slider_strategy_for(affordance)
+        start = time.perf_counter()
+        done = self._actuate(affordance, state, point, strategy)
+        if done is None:
+            # an unobserved outcome says nothing about accuracy
+            return None
+        key = (affordance.name, strategy.name)
+        n, total, misses = self._slider_model["cost"].get(key, (0, 0.0, 0))
+        n, total, misses = (
+            n + 1,
+            total + time.perf_counter() - start,
+            misses + (not done),
+        )
+        if n > 32:
+            n, total, misses = n / 2, total / 2, misses / 2
+        self._slider_model["cost"][key] = (n, total, misses)
+        return done
+
+    def _actuate(self, affordance, state, point, strategy):
+        states = self._states[affordance]
+        target = states[states.index(state)]
+        curr = states[self._vec[self._order[affordance]]]
+        if affordance in self.unverified:
+            # the modelled value is a guess: start from the stop nearest the target
+            low = target - states.low <= states.high - target
+            curr = states.low if low else states.high
+            sweep = (states.high - states.low) * self._per_unit("drag", affordance)
+            self._drag(point, round(2 * sweep) * (-1 if low else 1))
+            if curr == target:
+                observed = self._read(affordance)
+                if observed is None:
+                    return None
+                if observed == target:
+                    return True
+                curr = observed
+        fine = self._configured_strategy(affordance) is not Slider_Strategy.drag
+        for attempt in range(self.cycle_retries + 1):
+            # a drag lands close; residual corrections use exact wheel ticks
+            if strategy is Slider_Strategy.wheel or (attempt and fine):
+                kind, overshoot = "wheel", 2
+            else:
+                kind, overshoot = "drag", round(0.1 * DRAG_PIXELS)
+            sign = 1 if target > curr else -1
+            amount = round((target - curr) * self._per_unit(kind, affordance)) or sign
+            edge = target == states.low or target == states.high
+            if edge:
+                # overshoot into the stop so the bounds are hit exactly
+                amount += overshoot * sign
+            if kind == "drag":
+                self._drag(point, amount)
+            else:
+                self._scroll(point, amount)
+            if self.adaptive_settle:
+                observed = self._poll(affordance, target)
+            else:
+                observed = self._read(affordance)
+            if observed is None:
+                return None
+            moved = observed - curr
+            if moved * amount > 0 and not (edge and observed == target):
+                self._learn(kind, affordance, amount, moved)
+            if observed == target:
+                return True
+            curr = observed
+        self._set(affordance, states.index(curr))
+        return False
+
+    def _load_slider_model(self):
+        model = {"drag": {}, "wheel": {}, "cost": {}}
+        if self.slider_model_cache is None:
+            return model
+        try:
+            with open(self.slider_model_cache, "rb") as f:
+                cached = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return model
+        if isinstance(cached, dict) and cached.keys() == model.keys():
+            # cost entries from before misses were counted are dropped
+            cached["cost"] = {k: v for k, v in cached["cost"].items() if len(v) == 3}
+            return cached
+        return model
+
+    def save_slider_model(self):
+        if self.slider_model_cache is None or not any(self._slider_model.values()):
+            return
+        tmp = f"{self.slider_model_cache}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(self._slider_model, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.slider_model_cache)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def calibrate_sliders(self, affordances=None, radius=12, tolerance=24):
+        # relative sliders have no value readback, so they are calibrated from
+        # screenshots: from the lower stop, the smallest drag or wheel turn that changes
+        # the drawing near the point and the smallest that draws the upper stop are
+        # searched; each slider is left at its lower stop
+        if affordances is None:
+            affordances = self._affordance_types.Click_Rel_Slider.value
+        calibrated = {}
+        for affordance in affordances:
+            states = self._states[affordance]
+            path = self.plan(affordance, self._state[affordance])
+            if path is None:
+                continue
+            for view, view_state in path:
+                self.do(view, view_state)
+            point = next(
+                p
+                for p, check in self._checks[affordance].items()
+                if _holds(check, self._vec)
+            )
+            self._to_lower_stop(point)
+            low = self._slider_image(point, radius)
+            self._to_lower_stop(point)
+            if not self._same(low, self._slider_image(point, radius), tolerance):
+                raise RuntimeError(
+                    f"calibrate_sliders: {affordance.name}: did not stay at its lower stop"
+                )
+            self._drag(point, 2 * DRAG_PIXELS)
+            high = self._slider_image(point, radius)
+            if self._same(low, high, tolerance):
+                raise RuntimeError(
+                    f"calibrate_sliders: {affordance.name}: no change drawn within {radius} pixels"
+                )
+            size = states.high - states.low
+            calibrated[affordance.name] = {}
+            for kind, limit in (("drag", 2 * DRAG_PIXELS), ("wheel", 2 * size)):
+                first = self._search(
+                    kind,
+                    point,
+                    limit,
+                    lambda image: not self._same(image, low, tolerance),
+                    radius,
+                )
+                last = self._search(
+                    kind,
+                    point,
+                    limit,
+                    lambda image: self._same(image, high, tolerance),
+                    radius,
+                )
+                if first is None or last is None:
+                    continue
+                # the two thresholds lie as far inside the range as the drawing is
+                # coarse, so they add up to one unit more than the range; a drag
+                # rounds to the nearest unit, which takes that unit off again
+                moved = size if kind == "drag" else size + 1
+                self._slider_model[kind][affordance.name] = (
+                    float(first + last),
+                    float(moved),
+                )
+                calibrated[affordance.name][kind] = (first + last) / moved
+            self._to_lower_stop(point)
+            self._set(affordance, 0)
+            self.unverified.discard(affordance)
+        return calibrated
+
+    def _to_lower_stop(self, point):
+        for _ in range(2):
+            self._drag(point, -2 * DRAG_PIXELS)
+
+    def _slider_image(self, point, radius):
+        image = self.backend.capture()
+        h, w = image.shape[:2]
+        x, y = round(point[0] * w), round(point[1] * h)
+        return image[
+            max(y - radius, 0) : y + radius + 1, max(x - radius, 0) : x + radius + 1, :3
+        ].astype(np.int16)
+
+    def _same(self, a, b, tolerance):
+        return int(np.abs(a - b).max()) <= tolerance
+
+    def _search(self, kind, point, limit, found, radius):
+        # smallest amount from the lower stop whose drawing satisfies found
+        lo, hi = 1, limit
+        while lo < hi:
+            mid = (lo + hi) // 2
+            self._to_lower_stop(point)
+            (self._drag if kind == "drag" else self._scroll)(point, mid)
+            if found(self._slider_image(point, radius)):
+                hi = mid
+            else:
+                lo = mid + 1
+        self._to_lower_stop(point)
+        (self._drag if kind == "drag" else self._scroll)(point, lo)
+        return lo if found(self._slider_image(point, radius)) else None
+
+    def _dropdown(self, affordance, state, record):
+        states = self._states[affordance]
+        choice = self._ordinal(affordance, state)
+        options = record["dropdown"] or {}
+        strategy = options.get("strategy", self.dropdown_strategy)
+        self._click(record["point"])
+        if strategy is Dropdown_Strategy.keys:
+            for _ in range(choice + 1):
+                self._kbd_down()
+            self._kbd_enter()
+        elif strategy is Dropdown_Strategy.batched:
+            self.backend.send_keys(f"{{VK_DOWN {choice + 1}}}{{ENTER}}")
+        elif strategy is Dropdown_Strategy.type_ahead:
+            prefix = _type_ahead([_label(s) for s in states], choice)
+            if prefix is None:
+                self.backend.send_keys(f"{{VK_DOWN {choice + 1}}}{{ENTER}}")
+            else:
+                self.backend.send_keys(_escape_keys(prefix) + "{ENTER}")
+        elif strategy is Dropdown_Strategy.click:
+            x, y = record["point"]
+            offset = options["offset"] + choice * options["item_height"]
+            self._click((x, y + offset / (self.B - self.T)))
+
+    def apply(self, target):
+        report = {"applied": [], "navigated": [], "skipped": [], "unverified": []}
+        pending = {}
+        for affordance, state in target.items():
+            if state not in self._states[affordance]:
+                raise ValueError(
+                    f"apply: {affordance}: {state}: requested state not among valid states: {self._states[affordance]}"
+                )
+            # ordinals, so a high-resolution value already set after quantization is
+            # not resent; guessed values are set regardless
+            if (
+                self._ordinal(affordance, state) != self._vec[self._order[affordance]]
+                or affordance in self.unverified
+            ):
+                pending[affordance] = state
+        views = {a: pending.pop(a) for a in list(pending) if a in self._views}
+
+        for affordance in [a for a in pending if not self._required(a, pending[a])]:
+            state = pending.pop(affordance)
+            report["applied" if self.do(affordance, state) else "skipped"].append(
+                (affordance, state)
+            )
+
+        final = {**self._state, **pending}
+        after = defaultdict(set)
+        for affordance, state in pending.items():
+            required = self._required(affordance, state)
+            early = not self._reachable(required, final) and self._reachable(
+                required, self._state
+            )
+            for other in self._referenced(required):
+                if other in pending and other is not affordance:
+                    if early:
+                        after[other].add(affordance)
+                    else:
+                        after[affordance].add(other)
+
+        while pending:
+            ready = [a for a in pending if not (after[a] & pending.keys())] or list(
+                pending
+            )
+            affordance = min(
+                ready,
+                key=lambda a: (self._nav_cost(a, pending[a]), self._order[a]),
+            )
+            state = pending.pop(affordance)
+            if self._reach(affordance, state, report) and self.do(affordance, state):
+                report["applied"].append((affordance, state))
+            else:
+                report["skipped"].append((affordance, state))
+
+        for affordance in sorted(
+            views, key=lambda a: -len(self._view_ancestors(a, views[a]))
+        ):
+            state = views[affordance]
+            if self._reach(affordance, state, report) and self.do(affordance, state):
+                report["applied"].append((affordance, state))
+            else:
+                report["skipped"].append((affordance, state))
+        report["unverified"] = [
+            (a, s) for a, s in report["applied"] if a in self.unverified
+        ]
+        return report
+
+    def _settle_time(self, affordances):
+        if self.adaptive_settle:
+            # GUI actions already waited for their readback in the GUI thread
+            affordances = [a for a in affordances if a in self._programmatic]
+        return max(
+            (self.settler.delay(type(a).__name__) for a in affordances), default=0.0
         )
 
-    def _click(self, point):
-        rect = self.app.window("MiniFreak").rectangle()
-        width, height = rect.right - rect.left, rect.bottom - rect.top
+    def _in_gui_thread(self, fn, *args, **kwargs):
+        # GUI actions of one instance stay serialized; instances run side by side.
+        # The work is submitted at once, so it runs while the caller goes on.
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix=self.outport_name)
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def do_async(self, affordance, state, navigate=False, settle=True, **kwargs):
+        if affordance in self._programmatic:
+            changed = await asyncio.to_thread(self.do, affordance, state, **kwargs)
+        else:
+            changed = await self._in_gui_thread(
+                self.do, affordance, state, navigate, **kwargs
+            )
+        if changed and settle:
+            await asyncio.sleep(self._settle_time((affordance,)))
+        return changed
+
+    async def apply_async(self, target, settle=True):
+        midi = {a: s for a, s in target.items() if a in self._programmatic}
+        gui = {a: s for a, s in target.items() if a not in self._programmatic}
+        blocking = {
+            other
+            for a, s in gui.items()
+            if s in self._states[a]
+            for other in self._referenced(self._required(a, s))
+        }
+        reports = [
+            await asyncio.to_thread(
+                self.apply, {a: s for a, s in midi.items() if a in blocking}
+            )
+        ]
+        task = self._in_gui_thread(self.apply, gui) if gui else None
+        try:
+            reports.append(
+                await asyncio.to_thread(
+                    self.apply, {a: s for a, s in midi.items() if a not in blocking}
+                )
+            )
+        finally:
+            # awaited even when the MIDI part fails, so the GUI work is not orphaned
+            if task is not None:
+                reports.append(await task)
+        merged = {
+            key: [entry for r in reports for entry in r[key]] for key in reports[0]
+        }
+        if settle:
+            await asyncio.sleep(
+                self._settle_time(a for a, _ in merged["applied"] + merged["navigated"])
+            )
+        return merged
+
+    def sync(self, verifier=None):
+        if verifier is None:
+            verifier = self.verifier
+        report = {
+            "read": [],
+            "changed": [],
+            "navigated": [],
+            "captures": 0,
+            "unread": [],
+        }
+        pending = {
+            a
+            for a in self._layout
+            if a not in self._programmatic
+            and len(self._states[a]) > 1
+            and type(a).__name__ != "Click_Hold_Toggle"
+        }
+        unread = []
+        while pending:
+            self._observe(pending, verifier, report)
+            # shown but not readable: revisiting would not help
+            unread.extend(a for a in pending if self._visible(a, self._vec))
+            pending.difference_update(unread)
+            path = self._sync_path(pending)
+            if not path:
+                break
+            for view, state in path:
+                self.do(view, state)
+                report["navigated"].append((view, state))
+        report["unread"] = sorted(pending.union(unread), key=self._order.get)
+        # their modelled values are defaults or stale; apply() sets them regardless
+        self.unverified.update(report["unread"])
+        return report
+
+    def _visible(self, affordance, vec):
+        return affordance not in self._checks or any(
+            _holds(check, vec) for check in self._checks[affordance].values()
+        )
+
+    def _observe(self, pending, verifier, report):
+        image = None
+        if verifier is not None:
+            image = self.backend.capture()
+            report["captures"] += 1
+        while True:
+            shown = {}
+            if image is not None:
+                # reading a view or a mode changes what else is on screen, so the
+                # one capture is judged again against what has been learned so far
+                result = verifier.verify(image, learn=False)
+                unclear = set()
+                for afford, old, new in result["mismatches"]:
+                    if new is None:
+                        unclear.add(afford)
+                    elif afford in pending:
+                        shown[afford] = new
+                for afford in result["verified"]:
+                    if afford in pending and afford not in unclear:
+                        shown.setdefault(afford, self._state[afford])
+            for afford in sorted(pending, key=self._order.get):
+                if afford in shown or not self._visible(afford, self._vec):
+                    continue
+                value = self.backend.read(afford)
+                if value in self._states[afford]:
+                    shown[afford] = value
+                    if afford in self._views:
+                        break
+            if not shown:
+                return
+            for afford, value in shown.items():
+                old = self._state[afford]
+                if old != value:
+                    self._set(afford, self._ordinal(afford, value))
+                    report["changed"].append((afford, old, value))
+                report["read"].append(afford)
+                pending.discard(afford)
+                self.unverified.discard(afford)
+
+    def _sync_path(self, pending):
+        paths = {}
+        for afford in pending:
+            for state in self._states[afford]:
+                path = self.plan(afford, state)
+                if path:
+                    paths.setdefault(tuple(path), None)
+                    break
+        best, score = None, 0.0
+        for path in paths:
+            vec = array("q", self._vec)
+            for view, state in path:
+                vec[self._order[view]] = self._ordinal(view, state)
+            revealed = sum(
+                1
+                for a in pending
+                if not self._visible(a, self._vec) and self._visible(a, vec)
+            )
+            if revealed / len(path) > score:
+                best, score = list(path), revealed / len(path)
+        return best
+
+    def _required(self, affordance, state):
+        if affordance in self._programmatic:
+            return ()
+        unions = self._unions.get(affordance)
+        if unions is not None:
+            return unions
+        return self._spec[affordance][state]["required"]
+
+    def _compiled_required(self, affordance, state):
+        if affordance in self._programmatic:
+            return ((),)
+        checks = self._union_checks.get(affordance)
+        if checks is not None:
+            return checks
+        return self._checks[affordance][state]
+
+    def _referenced(self, required):
+        return {
+            self._affordances[_requirement(opt)[0]] for conj in required for opt in conj
+        }
+
+    def _reachable(self, required, state):
+        return not required or any(
+            all(
+                self._affordances[_requirement(opt)[0]] in self._views
+                or state[self._affordances[_requirement(opt)[0]]]
+                in _requirement(opt)[1]
+                for opt in conj
+            )
+            for conj in required
+        )
+
+    def _nav_cost(self, affordance, state):
+        path = self.plan(affordance, state)
+        return len(self._states) if path is None else len(path)
+
+    def _view_ancestors(self, affordance, state):
+        return {
+            a
+            for a in self._referenced(self._required(affordance, state))
+            if a in self._views
+        }
+
+    def _reach(self, affordance, state, report):
+        path = self.plan(affordance, state)
+        if path is None:
+            return False
+        for view, view_state in path:
+            if not self.do(view, view_state):
+                return False
+            report["navigated"].append((view, view_state))
+        return True
+
+    def navigate(self, affordance, state):
+        path = self.plan(affordance, state)
+        if path is None:
+            raise ValueError(
+                f"navigate: {affordance}: {state}: requirements cannot be met from the current state"
+            )
+        for view, view_state in path:
+            self.do(view, view_state)
+        return path
+
+    def plan(self, affordance, state):
+        required = self._required(affordance, state)
+        if _holds(self._compiled_required(affordance, state), self._vec):
+            return []
+        scope = self._scopes.get((affordance, state))
+        if scope is None:
+            views, fixed = [], set()
+            frontier = [required]
+            while frontier:
+                for other in self._referenced(frontier.pop()):
+                    if other not in self._views:
+                        fixed.add(self._order[other])
+                    elif other not in views:
+                        views.append(other)
+                        frontier.extend(
+                            self._required(other, s) for s in self._states[other]
+                        )
+            scope = self._scopes[(affordance, state)] = (views, sorted(fixed))
+        views, fixed = scope
+        vec = self._vec
+        start = tuple(vec[self._order[v]] for v in views)
+        key = (affordance, state, start, tuple(vec[i] for i in fixed))
+        if key in self._plans:
+            self._plans.move_to_end(key)
+            return self._plans[key]
+
+        pos = {self._order[v]: k for k, v in enumerate(views)}
+
+        def localize(compiled):
+            return tuple(
+                tuple((pos[i], mask) for i, mask in conj if i in pos)
+                for conj in compiled
+                if all(mask >> vec[i] & 1 for i, mask in conj if i not in pos)
+            )
+
+        goal = localize(self._compiled_required(affordance, state))
+        edges = [
+            (k, view, o, localize(self._compiled_required(view, s)))
+            for k, view in enumerate(views)
+            for o, s in enumerate(self._states[view])
+        ]
+        parents, queue, path = {start: None}, deque((start,)), None
+        while queue:
+            node = queue.popleft()
+            if _holds(goal, node):
+                path = []
+                while parents[node] is not None:
+                    node, step = parents[node]
+                    path.append(step)
+                path.reverse()
+                break
+            for k, view, o, check in edges:
+                if node[k] == o:
+                    continue
+                succ = node[:k] + (o,) + node[k + 1 :]
+                if succ not in parents and _holds(check, node):
+                    parents[succ] = (node, (view, self._states[view][o]))
+                    queue.append(succ)
+        self._plans[key] = path
+        if len(self._plans) > PLAN_CACHE_SIZE:
+            self._plans.popitem(last=False)
+        return path
+
+    def invalidate_geometry(self):
+        self._rect = None
+
+    def _window_rect(self):
+        if self._rect is None or (
+            self.rect_revalidate_every is not None
+            and self._rect_clicks >= self.rect_revalidate_every
+        ):
+            self._rect, self._rect_clicks = self.backend.window_rect(), 0
+        self._rect_clicks += 1
+        return self._rect
+
+    def _coords(self, point):
+        left, top, right, bottom = self._window_rect()
         width_frac, height_frac = point
-        mouse.click(
-            coords=(rect.left + width * width_frac, rect.top + height * height_frac)
+        return (
+            left + (right - left) * width_frac,
+            top + (bottom - top) * height_frac,
         )
 
+    def _click(self, point, **kwargs):
+        self.backend.click(self._coords(point), **kwargs)
+
+    def _drag(self, point, pixels):
+        x, y = self._coords(point)
+        self.backend.drag((x, y), (x, y - pixels))
+
+    def _scroll(self, point, ticks):
+        self.backend.scroll(self._coords(point), ticks)
+
+    def _hold_click(self, point):
+        self.backend.press(self._coords(point))
+
+    def _release_click(self, point):
+        self.backend.release(self._coords(point))
+
     def _kbd_down(self):
-        keyboard.send_keys("{VK_DOWN}")
+        self.backend.send_keys("{VK_DOWN}")
 
     def _kbd_enter(self):
-        keyboard.send_keys("{ENTER}")
+        self.backend.send_keys("{ENTER}")
 
     def _send(self, ty, **kwargs):
-        if (
-            isinstance(self._outport, mido.ports.BaseOutput)
-            and not self._outport.closed
-        ):
-            self._outport.send(mido.Message(ty, **kwargs))
+        msg = mido.Message(ty, **kwargs)
+        if self.midi_queue is not None:
+            self.midi_queue.put(msg)
+        else:
+            self.backend.send(msg)
+
+    def _send_group(self, msgs, key):
+        if self.midi_queue is not None:
+            self.midi_queue.put_group(msgs, key)
+        else:
+            self.backend.send_many(msgs)
+
+    def _hires_messages(self, control, path, value):
+        msb, lsb = value >> 7, value & 0x7F
+        if path[0] == "cc14":
+            pairs = ((control, msb), (path[1], lsb))
+        elif path[0] == "nrpn":
+            pairs = ((99, path[1]), (98, path[2]), (6, msb), (38, lsb))
+        else:
+            raise ValueError(f"_hires_messages: {control}: unknown path {path}")
+        return tuple(
+            mido.Message("control_change", control=c, value=v) for c, v in pairs
+        )
+
+    def flush_midi(self, timeout=None):
+        return self.midi_queue is None or self.midi_queue.flush(timeout)
@@ -383,7 +383,7 @@ class superunison_preset(Enum):
 class Options(Enum):
     tab_primary = ("primary_tabs", frozenset(primary_tabs))
     primary_advanced = ("primary_tabs", frozenset((primary_tabs.Advanced,)))
-    primary_sequencer = ("sequencer", frozenset((primary_tabs.Sequencer,)))
+    primary_sequencer = ("primary_tabs", frozenset((primary_tabs.Sequencer,)))
     tab_fx = ("fx_tabs", frozenset(fx_tabs))
     fx_1 = ("fx_tabs", frozenset((fx_tabs.FX_1,)))
     fx_2 = ("fx_tabs", frozenset((fx_tabs.FX_2,)))
@@ -405,15 +405,15 @@ class Options(Enum):
     tab_lfos = ("lfo_tabs", frozenset(lfo_tabs))
     typ_rise_curve = ("rising_curve_types", frozenset(rising_curve_types))
     typ_falling_curve = ("falling_curve_types", frozenset(falling_curve_type))
-    mde_cycenv = ("cycenv_modes", frozenset(cycenv_mode))
-    env_mode = ("cycenv_modes", frozenset((cycenv_mode.Env,)))
-    run_mode = ("cycenv_modes", frozenset((cycenv_mode.Run,)))
-    loop_mode = ("cycenv_modes", frozenset((cycenv_mode.Loop,)))
-    mde_voices = ("voice_modes", frozenset(voice_mode))
-    mono_mode = ("voice_modes", frozenset((voice_mode.Mono,)))
-    uni_mode = ("voice_modes", frozenset((voice_mode.Unison,)))
-    polypara_mode = ("voice_modes", frozenset((voice_mode.Poly, voice_mode.Para)))
-    mde_env_retrigger = ("retrigger_settings_env", frozenset(env_retrigger_mode))
+    mde_cycenv = ("cycenv_mode", frozenset(cycenv_mode))
+    env_mode = ("cycenv_mode", frozenset((cycenv_mode.Env,)))
+    run_mode = ("cycenv_mode", frozenset((cycenv_mode.Run,)))
+    loop_mode = ("cycenv_mode", frozenset((cycenv_mode.Loop,)))
+    mde_voices = ("voice_mode", frozenset(voice_mode))
+    mono_mode = ("voice_mode", frozenset((voice_mode.Mono,)))
+    uni_mode = ("voice_mode", frozenset((voice_mode.Unison,)))
+    polypara_mode = ("voice_mode", frozenset((voice_mode.Poly, voice_mode.Para)))
+    mde_env_retrigger = ("env_retrigger_mode", frozenset(env_retrigger_mode))
     chd_octaves = ("chord_octaves", frozenset(chord_octaves))
     mde_seq_arp = ("sequencer_arpeggiator_modes", frozenset(sequencer_arpeggiator_modes))
     seq_arp_seq = ("sequencer_arpeggiator_modes", frozenset((sequencer_arpeggiator_modes.Seq,)))
@@ -424,8 +424,8 @@ class Options(Enum):
     mde_seq_oct = ("arpeggiator_octave_modes", frozenset(arpeggiator_octave_modes))
     mde_routing_adv = ("routing_slot", frozenset(routing_slot_adv))
     mde_routing_seq = ("routing_slot", frozenset(routing_slot_seq))
-    typ_osc_1 = ("osc_1_modes", frozenset(osc_1_mode))
-    typ_osc_2 = ("osc_2_modes", frozenset(set(osc_2_mode) | set(osc_1_mode)))
+    typ_osc_1 = ("osc_1_mode", frozenset(osc_1_mode))
+    typ_osc_2 = ("osc_2_mode", frozenset(set(osc_2_mode) | set(osc_1_mode)))
     typ_filter = ("filter_type", frozenset(filter_type))
     typ_fx_1_chorus = ("fx1_type", frozenset((fx_types_neither.Chorus,)))
     typ_fx_1_phaser = ("fx1_type", frozenset((fx_types_neither.Phaser,)))
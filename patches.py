@@ -0,0 +1,326 @@
+import numpy as np
+
+_SAMPLED = (
+    "Midi_Disc_Toggle",
+    "Midi_Cont_Toggle",
+    "Midi_Slider",
+    "Click_Select",
+    "Click_Toggle",
+    "Click_Cycle",
+    "Click_Dropdown",
+    "Click_Rel_Slider",
+)
+
+
+class Patch_Sampler:
+    def __init__(self, mf, density=1.0, seed=None, stratified=False, affordances=None):
+        self.mf = mf
+        self.density = density
+        self.stratified = stratified
+        self.rng = np.random.default_rng(seed)
+        self._base = np.frombuffer(mf.snapshot(), dtype=np.int64)
+        self._view_positions = {mf._order[v] for v in mf._views}
+        pool = [
+            a
+            for a in (mf._layout if affordances is None else affordances)
+            if type(a).__name__ in _SAMPLED
+            and a not in mf._views
+            and len(mf._states[a]) > 1
+        ]
+        constraints = {a: self._constraints(a) for a in pool}
+        self._columns = [
+            (a, mf._order[a], len(mf._states[a]), constraints[a])
+            for a in self._dependency_order(pool, constraints)
+        ]
+        # a partial patch must carry the modes its entries were sampled under
+        self._requires = [
+            (
+                pos,
+                sorted(
+                    {p for dnf in per_state for conj in dnf for p, _ in conj} - {pos}
+                ),
+            )
+            for _, pos, _, per_state in reversed(self._columns)
+            if per_state is not None
+        ]
+
+    def _constraints(self, affordance):
+        mf = self.mf
+        checks = mf._checks.get(affordance)
+        if checks is None:
+            return None
+        states = mf._states[affordance]
+
+        # views are navigated by apply(); only parameter modes constrain a patch
+        def strip(compiled):
+            return tuple(
+                tuple(
+                    (pos, self._table(pos, mask))
+                    for pos, mask in conj
+                    if pos not in self._view_positions
+                )
+                for conj in compiled
+            )
+
+        if type(affordance).__name__ in (
+            "Click_Select",
+            "Click_Cycle",
+            "Click_Dropdown",
+        ):
+            per_state = [strip(checks[s]) for s in states]
+        else:
+            reachable = tuple(
+                conj for check in checks.values() for conj in strip(check)
+            )
+            per_state = [reachable] * len(states)
+        if all(() in dnf for dnf in per_state):
+            return None
+        return per_state
+
+    def _table(self, pos, mask):
+        size = len(self.mf._states[self.mf._layout[pos]])
+        return np.array([(mask >> i) & 1 for i in range(size)], dtype=bool)
+
+    def _dependency_order(self, pool, constraints):
+        positions = {self.mf._order[a]: a for a in pool}
+        deps = {
+            a: {
+                positions[pos]
+                for dnf in (constraints[a] or ())
+                for conj in dnf
+                for pos, _ in conj
+                if pos in positions and positions[pos] is not a
+            }
+            for a in pool
+        }
+        ordered, done = [], set()
+        while len(ordered) < len(pool):
+            ready = [a for a in pool if a not in done and deps[a] <= done]
+            if not ready:
+                # walk unmet dependencies until one repeats to find a cycle member
+                a, seen = next(a for a in pool if a not in done), set()
+                while a not in seen:
+                    seen.add(a)
+                    a = next(d for d in pool if d in deps[a] and d not in done)
+                ready = [a]
+            for a in ready:
+                ordered.append(a)
+                done.add(a)
+        return ordered
+
+    def _holds(self, dnf, vec):
+        out = np.zeros(len(vec), dtype=bool)
+        for conj in dnf:
+            if not conj:
+                return np.ones(len(vec), dtype=bool)
+            term = np.ones(len(vec), dtype=bool)
+            for pos, table in conj:
+                term &= table[vec[:, pos]]
+            out |= term
+        return out
+
+    def sample(self, n):
+        rng = self.rng
+        vec = np.tile(self._base, (n, 1))
+        mask = np.zeros(vec.shape, dtype=bool)
+        rows = np.arange(n)
+        for _, pos, size, per_state in self._columns:
+            include = (
+                rng.random(n) < self.density if self.density < 1 else np.ones(n, bool)
+            )
+            if self.stratified:
+                want = rng.permutation(np.resize(np.arange(size), n))
+            else:
+                want = rng.integers(size, size=n)
+            if per_state is not None:
+                valid = np.empty((n, size), dtype=bool)
+                for s, dnf in enumerate(per_state):
+                    valid[:, s] = self._holds(dnf, vec)
+                bad = ~valid[rows, want]
+                if bad.any():
+                    weights = rng.random((int(bad.sum()), size)) * valid[bad]
+                    want[bad] = weights.argmax(axis=1)
+                    include[bad] &= valid[bad].any(axis=1)
+            vec[include, pos] = want[include]
+            mask[include, pos] = True
+        return vec, mask
+
+    def _chunks(self, n, chunk):
+        while n is None or n > 0:
+            size = chunk if n is None else min(chunk, n)
+            yield self.sample(size)
+            if n is not None:
+                n -= size
+
+    def _with_requirements(self, mask):
+        mask = mask.copy()
+        for pos, required in self._requires:
+            for p in required:
+                mask[:, p] |= mask[:, pos]
+        return mask
+
+    def patches(self, n=None, chunk=4096):
+        layout, states = self.mf._layout, self.mf._states
+        for vec, mask in self._chunks(n, chunk):
+            mask = self._with_requirements(mask)
+            for row, cols in zip(vec, mask):
+                yield {
+                    layout[c]: states[layout[c]][int(row[c])]
+                    for c in np.flatnonzero(cols)
+                }
+
+    def snapshots(self, n=None, chunk=4096):
+        for vec, _ in self._chunks(n, chunk):
+            for row in vec:
+                yield row.tobytes()
+
+    def coverage(self, vec, mask):
+        return {
+            a: len(np.unique(vec[mask[:, pos], pos])) / size
+            for a, pos, size, _ in self._columns
+        }
+
+
+class Patch_Scheduler:
+    def __init__(self, mf):
+        self.mf = mf
+        self._view_positions = {mf._order[v] for v in mf._views}
+        self._columns, groups = [], {}
+        for a in mf._layout:
+            size = len(mf._states[a])
+            if size < 2 or a in mf._views or a in mf._programmatic:
+                continue
+            table = self._table(a, size)
+            if table is None:
+                continue
+            views = frozenset(
+                pos
+                for check in mf._checks[a].values()
+                for conj in check
+                for pos, _ in conj
+                if pos in self._view_positions
+            )
+            groups.setdefault(views, []).append(len(self._columns))
+            self._columns.append((mf._order[a], table))
+        self._groups = [(len(views), cols) for views, cols in groups.items() if views]
+
+    def _table(self, affordance, size):
+        at = type(affordance).__name__
+        a, b = np.meshgrid(np.arange(size), np.arange(size), indexing="ij")
+        if at == "Click_Select" or at == "Click_Toggle" or at == "Click_Rel_Slider":
+            table = np.ones((size, size))
+        elif at == "Click_Cycle":
+            table = (b - a) % size
+            if any(
+                r["reverse"] is not None for r in self.mf._spec[affordance].values()
+            ):
+                table = np.minimum(table, (a - b) % size)
+        elif at == "Click_Dropdown":
+            table = np.full((size, size), 2.0)
+            options = self.mf._spec[affordance][self.mf._states[affordance][0]][
+                "dropdown"
+            ]
+            strategy = (options or {}).get("strategy", self.mf.dropdown_strategy)
+            if strategy.name == "keys":
+                table = table + b
+        else:
+            return None
+        table = np.asarray(table, dtype=float)
+        np.fill_diagonal(table, 0.0)
+        return table
+
+    def _rows(self, patches):
+        mf = self.mf
+        rows = [
+            np.frombuffer(p if isinstance(p, bytes) else mf.snapshot(p), dtype=np.int64)
+            for p in patches
+        ]
+        return np.stack(rows) if rows else np.empty((0, len(mf._layout)), np.int64)
+
+    def costs(self, src, dst):
+        cost = np.zeros((len(src), len(dst)))
+        changed = []
+        for pos, table in self._columns:
+            a, b = src[:, pos], dst[:, pos]
+            cost += table[a[:, None], b[None, :]]
+            changed.append(a[:, None] != b[None, :])
+        for depth, cols in self._groups:
+            touched = np.zeros(cost.shape, dtype=bool)
+            for c in cols:
+                touched |= changed[c]
+            cost += depth * touched
+        return cost
+
+    def order(self, patches, start=None, passes=10):
+        rows = self._rows(patches)
+        start = np.frombuffer(
+            self.mf.snapshot() if start is None else start, dtype=np.int64
+        )
+        n = len(rows)
+        if n == 0:
+            return [], {
+                "initial": 0.0,
+                "ordered": 0.0,
+                "saved": 0.0,
+                "saved_fraction": None,
+            }
+        nodes = np.vstack([start, rows])
+        cost = self.costs(nodes, nodes)
+        initial = self._path_cost(cost, np.arange(n + 1))
+        path = self._nearest_neighbour(cost)
+        path = self._two_opt(cost, path, passes)
+        ordered = self._path_cost(cost, path)
+        return [int(i) - 1 for i in path[1:]], {
+            "initial": initial,
+            "ordered": ordered,
+            "saved": initial - ordered,
+            "saved_fraction": (initial - ordered) / initial if initial else None,
+        }
+
+    def _path_cost(self, cost, path):
+        return float(cost[path[:-1], path[1:]].sum())
+
+    def _nearest_neighbour(self, cost):
+        n = len(cost)
+        visited = np.zeros(n, dtype=bool)
+        path = [0]
+        visited[0] = True
+        for _ in range(n - 1):
+            row = np.where(visited, np.inf, cost[path[-1]])
+            path.append(int(row.argmin()))
+            visited[path[-1]] = True
+        return np.array(path)
+
+    def _two_opt(self, cost, path, passes):
+        # the start node stays fixed and the path is open; costs may be asymmetric
+        n = len(path)
+        for _ in range(passes):
+            improved = False
+            for i in range(1, n - 1):
+                fwd = np.concatenate(([0.0], np.cumsum(cost[path[:-1], path[1:]])))
+                rev = np.concatenate(([0.0], np.cumsum(cost[path[1:], path[:-1]])))
+                j = np.arange(i + 1, n)
+                inner = (fwd[j] - fwd[i]) - (rev[j] - rev[i])
+                before = cost[path[i - 1], path[i]] - cost[path[i - 1], path[j]]
+                after = np.zeros(len(j))
+                tail = j < n - 1
+                after[tail] = (
+                    cost[path[j[tail]], path[j[tail] + 1]]
+                    - cost[path[i], path[j[tail] + 1]]
+                )
+                gain = before + after + inner
+                best = int(gain.argmax())
+                if gain[best] > 1e-9:
+                    path[i : j[best] + 1] = path[i : j[best] + 1][::-1].copy()
+                    improved = True
+            if not improved:
+                break
+        return path
+
+    def targets(self, patches, order, start=None):
+        rows = self._rows(patches)
+        prev = self.mf.snapshot() if start is None else start
+        for i in order:
+            row = rows[i].tobytes()
+            yield self.mf.diff(prev, row)
+            prev = row
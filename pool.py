@@ -0,0 +1,182 @@
+import multiprocessing
+import queue
+import traceback
+
+from backends import Fake_Backend, Pywinauto_Backend
+from minifreak import MiniFreak
+
+
+def portable(mf, patch):
+    return {(type(a).__name__, a.name): s for a, s in patch.items()}
+
+
+def resolve(mf, patch):
+    if isinstance(patch, bytes):
+        return mf.patch_from_snapshot(patch)
+    return {
+        getattr(mf._affordance_types, at).value[name]: s
+        for (at, name), s in patch.items()
+    }
+
+
+def apply_patch(mf, patch):
+    report = mf.apply(patch)
+    return {
+        "applied": len(report["applied"]),
+        "navigated": len(report["navigated"]),
+        "skipped": len(report["skipped"]),
+        "unverified": len(report["unverified"]),
+        "snapshot": mf.snapshot(),
+    }
+
+
+def instances(n, backend="pywinauto", outport_prefix="loopMIDI Port", **kwargs):
+    return [
+        {"backend": backend, "outport_name": f"{outport_prefix} {i + 1}", **kwargs}
+        for i in range(n)
+    ]
+
+
+def _worker(index, config, job, tasks, results):
+    config = dict(config)
+    kind = config.pop("backend", "pywinauto")
+    latency = config.pop("latency", None)
+    window_title = config.pop("window_title", None)
+    try:
+        if kind == "fake":
+            backend = Fake_Backend(latency=latency)
+        elif kind == "pywinauto":
+            backend = Pywinauto_Backend(window_title)
+        else:
+            raise ValueError(f"_worker: {kind}: unknown backend")
+        with MiniFreak(backend=backend, **config) as mf:
+            results.put(("ready", index, None))
+            while True:
+                task = tasks.get()
+                if task is None:
+                    break
+                batch, task = task
+                done = []
+                for i, patch in task:
+                    try:
+                        done.append((i, job(mf, resolve(mf, patch)), None))
+                    except Exception:
+                        done.append((i, None, traceback.format_exc()))
+                results.put(("done", index, (batch, done)))
+    except Exception:
+        results.put(("error", index, traceback.format_exc()))
+
+
+class Worker_Pool:
+    def __init__(self, configs, job=apply_patch, chunk=16, context="spawn", poll=1.0):
+        self.configs = list(configs)
+        self.job = job
+        self.chunk = chunk
+        self.poll = poll
+        self._batch = 0
+        self._ctx = multiprocessing.get_context(context)
+        self._workers = []
+        self._tasks = self._results = None
+
+    def start(self):
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._workers = [
+            self._ctx.Process(
+                target=_worker,
+                args=(i, config, self.job, self._tasks, self._results),
+                daemon=True,
+            )
+            for i, config in enumerate(self.configs)
+        ]
+        for worker in self._workers:
+            worker.start()
+        try:
+            for _ in self._workers:
+                kind, index, error = self._get("start")
+                if kind == "error":
+                    raise RuntimeError(f"start: worker {index} failed:\n{error}")
+        except RuntimeError:
+            self.close()
+            raise
+        return self
+
+    def _get(self, caller):
+        # a worker that dies hard never reports, so waiting also watches liveness
+        while True:
+            try:
+                return self._results.get(timeout=self.poll)
+            except queue.Empty:
+                pass
+            for index, worker in enumerate(self._workers):
+                if not worker.is_alive():
+                    raise RuntimeError(
+                        f"{caller}: worker {index} exited with code {worker.exitcode}"
+                    )
+
+    def _discard_tasks(self):
+        while True:
+            try:
+                self._tasks.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self):
+        for worker in self._workers:
+            if worker.is_alive():
+                self._tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def imap(self, patches):
+        patches = list(patches)
+        # results of an abandoned batch may still arrive and must not be taken as ours
+        self._batch += 1
+        batch = self._batch
+        for start in range(0, len(patches), self.chunk):
+            self._tasks.put(
+                (
+                    batch,
+                    [
+                        (i, patches[i])
+                        for i in range(start, min(start + self.chunk, len(patches)))
+                    ],
+                )
+            )
+        remaining = len(patches)
+        try:
+            while remaining:
+                kind, index, payload = self._get("imap")
+                if kind == "error":
+                    raise RuntimeError(f"imap: worker {index} failed:\n{payload}")
+                tag, done = payload
+                if tag != batch:
+                    continue
+                for i, result, error in done:
+                    remaining -= 1
+                    yield i, index, result, error
+        finally:
+            if remaining:
+                self._discard_tasks()
+
+    def map(self, patches):
+        results = [None] * len(patches)
+        done = self.imap(patches)
+        try:
+            for i, worker, result, error in done:
+                if error is not None:
+                    raise RuntimeError(
+                        f"map: patch {i} failed on worker {worker}:\n{error}"
+                    )
+                results[i] = result
+        finally:
+            done.close()
+        return results
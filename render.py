@@ -0,0 +1,235 @@
+import os
+import queue
+import threading
+import time
+import wave
+
+import numpy as np
+
+from automation import wait_until
+
+DEFAULT_PROGRAM = ((0.0, 60, 100, 1.0),)
+
+
+def program_events(program):
+    events = []
+    for start, note, velocity, duration in program:
+        events.append((start, 1, "note_on", note, velocity))
+        events.append((start + duration, 0, "note_off", note, 0))
+    # note_offs sort ahead of note_ons at the same instant so repeated notes retrigger
+    return [(t, ty, note, velocity) for t, _, ty, note, velocity in sorted(events)]
+
+
+def program_length(program):
+    return max((start + duration for start, _, _, duration in program), default=0.0)
+
+
+class Capture:
+    samplerate = 48000
+    channels = 1
+
+    def start(self, duration):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+
+class File_Capture(Capture):
+    def __init__(self, path, loop=True):
+        with wave.open(path, "rb") as f:
+            self.samplerate = f.getframerate()
+            self.channels = f.getnchannels()
+            width = f.getsampwidth()
+            frames = f.readframes(f.getnframes())
+        if width not in (1, 2, 4):
+            raise ValueError(f"File_Capture: {path}: unsupported sample width {width}")
+        dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[width]
+        data = np.frombuffer(frames, dtype=dtype).astype(np.float32)
+        if width == 1:
+            data -= 128.0
+        self.data = data.reshape(-1, self.channels) / float(1 << (8 * width - 1))
+        self.loop = loop
+        self._pos = 0
+        self._frames = None
+
+    def start(self, duration):
+        self._frames = int(round(duration * self.samplerate))
+
+    def stop(self):
+        n, self._frames = self._frames, None
+        if n is None:
+            raise RuntimeError("stop: capture was not started")
+        if self.loop:
+            index = (self._pos + np.arange(n)) % len(self.data)
+            out = self.data[index]
+        else:
+            out = np.zeros((n, self.channels), dtype=np.float32)
+            chunk = self.data[self._pos : self._pos + n]
+            out[: len(chunk)] = chunk
+        self._pos = (self._pos + n) % len(self.data) if self.loop else self._pos + n
+        return out
+
+
+class Shard_Writer:
+    def __init__(
+        self, directory, layout, shard_size=64, prefix="shard", compress=False
+    ):
+        self.directory = directory
+        self.layout = np.array([f"{type(a).__name__}.{a.name}" for a in layout])
+        self.shard_size = shard_size
+        self.prefix = prefix
+        self.compress = compress
+        self.shards = []
+        self._patches, self._audio = [], []
+        self._meta = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, vector, audio, **meta):
+        self._patches.append(vector)
+        self._audio.append(audio)
+        self._meta.update(meta)
+        if len(self._patches) >= self.shard_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._patches:
+            return
+        frames = max(len(a) for a in self._audio)
+        channels = self._audio[0].shape[1]
+        audio = np.zeros((len(self._audio), frames, channels), dtype=np.float32)
+        for i, a in enumerate(self._audio):
+            audio[i, : len(a)] = a
+        path = os.path.join(self.directory, f"{self.prefix}_{len(self.shards):05d}.npz")
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        save = np.savez_compressed if self.compress else np.savez
+        try:
+            save(
+                tmp,
+                patches=np.stack(self._patches),
+                audio=audio,
+                layout=self.layout,
+                **{k: np.asarray(v) for k, v in self._meta.items()},
+            )
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.shards.append(path)
+        self._patches, self._audio = [], []
+
+    def close(self):
+        self._flush()
+
+
+class Render_Pipeline:
+    def __init__(
+        self,
+        mf,
+        capture,
+        writer,
+        program=DEFAULT_PROGRAM,
+        settle=0.05,
+        tail=0.5,
+        queue_size=8,
+        channel=0,
+        verifier=None,
+    ):
+        self.mf = mf
+        self.capture = capture
+        self.writer = writer
+        self.program = tuple(program)
+        self.settle = settle
+        self.tail = tail
+        self.channel = channel
+        self.verifier = verifier
+        self._events = program_events(self.program)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+
+    def _play(self, start):
+        for t, ty, note, velocity in self._events:
+            wait_until(start + t)
+            self.mf._send(ty, channel=self.channel, note=note, velocity=velocity)
+        self.mf.flush_midi()
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                if self._error is None:
+                    self.writer.write(*item[:2], **item[2])
+            except Exception as e:
+                self._error = e
+
+    def _target(self, patch):
+        if isinstance(patch, bytes):
+            return self.mf.patch_from_snapshot(patch)
+        return patch
+
+    def render(self, patches):
+        mf = self.mf
+        if self.verifier is not None and not self.verifier.calibrated:
+            raise RuntimeError(
+                "render: verifier is not calibrated; call calibrate() first"
+            )
+        duration = program_length(self.program) + self.tail
+        writer = threading.Thread(target=self._write, daemon=True)
+        writer.start()
+        timings = {"apply_s": 0.0, "record_s": 0.0, "queue_wait_s": 0.0}
+        count, skipped, mismatched = 0, 0, 0
+        try:
+            for patch in patches:
+                t = time.perf_counter()
+                skipped += len(mf.apply(self._target(patch))["skipped"])
+                mf.flush_midi()
+                time.sleep(self.settle)
+                if self.verifier is not None:
+                    # one capture per patch; drift is resynced and the patch reapplied once
+                    if self.verifier.verify(fix=True)["mismatches"]:
+                        mismatched += 1
+                        skipped += len(mf.apply(self._target(patch))["skipped"])
+                        time.sleep(self.settle)
+                vector = np.frombuffer(mf.snapshot(), dtype=np.int64).copy()
+                timings["apply_s"] += time.perf_counter() - t
+
+                t = start = time.perf_counter()
+                self.capture.start(duration)
+                player = threading.Thread(target=self._play, args=(start,), daemon=True)
+                player.start()
+                wait_until(start + duration)
+                player.join()
+                audio = self.capture.stop()
+                timings["record_s"] += time.perf_counter() - t
+
+                t = time.perf_counter()
+                self._queue.put(
+                    (
+                        vector,
+                        audio,
+                        {
+                            "samplerate": self.capture.samplerate,
+                            "program": np.array(self.program, dtype=float),
+                        },
+                    )
+                )
+                timings["queue_wait_s"] += time.perf_counter() - t
+                count += 1
+                if self._error is not None:
+                    break
+        finally:
+            self._queue.put(None)
+            writer.join()
+        if self._error is not None:
+            raise self._error
+        self.writer.close()
+        return {
+            "patches": count,
+            "skipped": skipped,
+            "mismatched": mismatched,
+            "shards": list(self.writer.shards),
+            **timings,
+        }
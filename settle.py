@@ -0,0 +1,64 @@
+from collections import deque
+
+import numpy as np
+
+
+class Settle_Estimator:
+    def __init__(
+        self,
+        priors,
+        percentile=95.0,
+        margin=1.25,
+        window=256,
+        min_samples=8,
+        floor=0.0,
+        ceiling=2.0,
+    ):
+        self.priors = dict(priors)
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.floor = floor
+        self.ceiling = ceiling
+        self.timeouts = {}
+        self._samples = {}
+        self._window = window
+        self._cache = {}
+
+    def observe(self, kind, seconds):
+        self._samples.setdefault(kind, deque(maxlen=self._window)).append(seconds)
+        self._cache.pop(kind, None)
+
+    def timed_out(self, kind):
+        self.timeouts[kind] = self.timeouts.get(kind, 0) + 1
+
+    def delay(self, kind):
+        cached = self._cache.get(kind)
+        if cached is not None:
+            return cached
+        samples = self._samples.get(kind, ())
+        if len(samples) < self.min_samples:
+            estimate = self.priors.get(kind, 0.0)
+        else:
+            estimate = self.margin * float(np.percentile(samples, self.percentile))
+        estimate = min(max(estimate, self.floor), self.ceiling)
+        self._cache[kind] = estimate
+        return estimate
+
+    def timeout(self, kind):
+        # generous bound for polling; the prior guards against a too-optimistic start
+        return min(
+            max(4 * self.delay(kind), 2 * self.priors.get(kind, 0.0), 0.05),
+            4 * self.ceiling,
+        )
+
+    def stats(self):
+        return {
+            kind: {
+                "n": len(samples),
+                "p50_s": float(np.percentile(samples, 50)) if samples else None,
+                "delay_s": self.delay(kind),
+                "timeouts": self.timeouts.get(kind, 0),
+            }
+            for kind, samples in self._samples.items()
+        }
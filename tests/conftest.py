@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import Fake_Backend
+from minifreak import MiniFreak
+
+
+def make(**kwargs):
+    backend = kwargs.pop("backend", None) or Fake_Backend()
+    return MiniFreak(
+        backend=backend, affordance_cache=None, slider_model_cache=None, **kwargs
+    )
+
+
+@pytest.fixture
+def mf():
+    return make()
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from automation import Automation, render_curve
+from minifreak import Mf_Midi_Slider
+
+
+def test_render_curve_quantizes_and_drops_repeats():
+    times, values = render_curve([(0.0, 0.0), (1.0, 10.0)], resolution=0.01)
+    assert values.tolist() == list(range(11))
+    assert np.allclose(times, np.round(times / 0.01) * 0.01)
+    assert np.all(np.diff(times) > 0)
+
+
+def test_render_curve_clips_and_sorts():
+    times, values = render_curve([(1.0, 300.0), (0.0, -20.0)], resolution=0.1)
+    assert times[0] == 0.0 and values[0] == 0
+    assert values[-1] == 127 and values.max() == 127
+    assert render_curve(np.full(50, 64.0), duration=1.0)[1].tolist() == [64]
+    with pytest.raises(ValueError):
+        render_curve(np.zeros(4))
+
+
+def test_stream_orders_events_across_controls(mf):
+    automation = Automation(mf)
+    automation.add(Mf_Midi_Slider.mod_wheel, [(0.0, 0.0), (0.1, 10.0)])
+    automation.add(Mf_Midi_Slider.glide, [(0.0, 5.0), (0.1, 15.0)], offset=0.005)
+    events = automation.stream()
+    times = [t for t, _, _ in events]
+    assert times == sorted(times)
+    assert {a.name for _, a, _ in events} == {"mod_wheel", "glide"}
+    assert events[0][1].name == "mod_wheel" and events[1][1].name == "glide"
+
+
+def test_play_sends_every_event(mf):
+    automation = Automation(mf)
+    count = automation.add(Mf_Midi_Slider.mod_wheel, [(0.0, 1.0), (0.05, 20.0)])
+    assert automation.play()["events"] == count
+    values = [m.value for m in mf.backend.messages]
+    assert values == [v for _, _, v in automation.stream()] and len(values) == count
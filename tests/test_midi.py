@@ -0,0 +1,75 @@
+import threading
+import time
+
+import mido
+import pytest
+
+from midi import Midi_Queue
+
+
+def cc(control, value):
+    return mido.Message("control_change", control=control, value=value)
+
+
+def test_coalesces_pending_control_changes():
+    gate, sent = threading.Event(), []
+
+    def send(msg):
+        gate.wait()
+        sent.append(msg)
+
+    queue = Midi_Queue(send, max_rate=None)
+    queue.put(cc(1, 0))
+    for value in range(1, 50):
+        queue.put(cc(2, value))
+    gate.set()
+    assert queue.flush(timeout=5)
+    queue.close()
+    assert sent[-1] == cc(2, 49)
+    assert queue.coalesced > 0
+    assert len(sent) + queue.coalesced == 50
+
+
+def test_unkeyed_messages_keep_order():
+    sent = []
+    queue = Midi_Queue(sent.append, max_rate=None)
+    msgs = [mido.Message("note_on", note=n) for n in range(20)]
+    for msg in msgs:
+        queue.put(msg)
+    queue.close()
+    assert sent == msgs
+
+
+def test_groups_go_out_together():
+    batches = []
+    queue = Midi_Queue(lambda msg: batches.append((msg,)), None, batches.append)
+    group = (cc(99, 1), cc(98, 2), cc(6, 3), cc(38, 4))
+    queue.put_group(group, ("nrpn", 1))
+    queue.close()
+    assert batches == [group]
+
+
+def test_rate_is_limited():
+    sent = []
+    queue = Midi_Queue(sent.append, max_rate=200.0)
+    start = time.perf_counter()
+    for n in range(10):
+        queue.put(mido.Message("note_on", note=n))
+    queue.close()
+    assert len(sent) == 10
+    # one interval of slack lets the first two go back to back
+    assert time.perf_counter() - start >= 8 / 200.0
+
+
+def test_send_errors_surface():
+    def send(msg):
+        raise OSError("port closed")
+
+    queue = Midi_Queue(send, max_rate=None)
+    queue.put(cc(1, 0))
+    with pytest.raises(OSError):
+        queue.flush(timeout=5)
+    with pytest.raises(OSError):
+        queue.put(cc(1, 1))
+    with pytest.raises(OSError):
+        queue.close()
@@ -0,0 +1,508 @@
+import asyncio
+import pickle
+import random
+
+import pytest
+
+from backends import Backend, Fake_Backend
+from conftest import make
+import minifreak
+from minifreak import (
+    Dropdown_Strategy,
+    Float_Domain,
+    Frozen_Dict,
+    Mf_Midi_Slider,
+    MiniFreak,
+    Slider_Strategy,
+    Toggle_State,
+    _holds,
+    _requirement,
+)
+from patches import Patch_Sampler
+
+
+def _gui_targets(mf, n, seed=0):
+    rnd = random.Random(seed)
+    pairs = [
+        (a, s)
+        for a in mf._state
+        if a not in mf._programmatic
+        and type(a).__name__
+        in ("Click_Select", "Click_Toggle", "Click_Cycle", "Click_Dropdown")
+        for s in mf._states[a]
+    ]
+    return rnd.sample(pairs, n)
+
+
+def test_plan_reaches_requirements(mf):
+    for affordance, state in _gui_targets(mf, 150):
+        path = mf.plan(affordance, state)
+        if path is None:
+            continue
+        for view, view_state in path:
+            assert view in mf._views
+            mf._set(view, mf._ordinal(view, view_state))
+        assert _holds(mf._compiled_required(affordance, state), mf._vec)
+
+
+def test_plan_cache_is_bounded(mf, monkeypatch):
+    monkeypatch.setattr(minifreak, "PLAN_CACHE_SIZE", 8)
+    for affordance, state in _gui_targets(mf, 100, seed=1):
+        mf.plan(affordance, state)
+    assert len(mf._plans) <= 8
+
+
+def _meets(mf, required):
+    return not required or any(
+        all(
+            mf._state[mf._affordances[_requirement(opt)[0]]] in _requirement(opt)[1]
+            for opt in conj
+        )
+        for conj in required
+    )
+
+
+def test_compiled_checks_match_requirements(mf):
+    rnd = random.Random(4)
+    gui = [a for a in mf._state if a not in mf._programmatic]
+    for _ in range(5):
+        for a in gui:
+            mf._set(a, rnd.randrange(len(mf._states[a])))
+        for a, checks in mf._checks.items():
+            for key, record in mf._spec[a].items():
+                required = record["required"] if isinstance(record, dict) else record
+                assert _holds(checks[key], mf._vec) == _meets(mf, required)
+
+
+def test_union_checks_are_built_once(mf):
+    toggle = _shown_toggle(mf)
+    first = mf._compiled_required(toggle, Toggle_State.On)
+    assert mf._required(toggle, Toggle_State.On) is mf._unions[toggle]
+    for _ in range(3):
+        assert mf._compiled_required(toggle, Toggle_State.Off) is first
+
+
+def _shares_point(mf, affordance, state):
+    # upstream places some routing items on the point of another item
+    records = mf._spec[affordance]
+    point = records[state]["point"]
+    return sum(r["point"] == point for r in records.values()) > 1
+
+
+def test_apply_matches_fake_ui(mf):
+    for affordance, state in _gui_targets(mf, 60, seed=3):
+        if type(affordance).__name__ == "Click_Select" and _shares_point(
+            mf, affordance, state
+        ):
+            continue
+        mf.apply({affordance: state})
+    assert all(mf.backend.ui[a] == mf._state[a] for a in mf.backend.ui)
+
+
+def _shown_toggle(mf):
+    return next(
+        a
+        for a in mf._state
+        if type(a).__name__ == "Click_Toggle" and mf.plan(a, Toggle_State.On) == []
+    )
+
+
+def test_toggle_states(mf):
+    toggle = _shown_toggle(mf)
+    assert mf.do(toggle, Toggle_State.On)
+    assert mf.backend.ui[toggle] is Toggle_State.On
+    assert not mf.do(toggle, Toggle_State.On)
+
+
+def _flip(mf, toggle, times):
+    for _ in range(times):
+        on = mf._state[toggle] is Toggle_State.On
+        assert mf.do(toggle, Toggle_State.Off if on else Toggle_State.On)
+        assert mf.backend.ui[toggle] is mf._state[toggle]
+
+
+def _rects(mf):
+    return sum(1 for e in mf.backend.events if e[0] == "rect")
+
+
+def test_window_geometry_is_cached(mf):
+    toggle = _shown_toggle(mf)
+    _flip(mf, toggle, 4)
+    assert _rects(mf) == 1
+    mf.backend.move((40, 30, 1982, 1325))
+    _flip(mf, toggle, 2)
+    assert _rects(mf) == 2
+
+
+def test_window_geometry_is_revalidated():
+    mf = make(rect_revalidate_every=2)
+    toggle = _shown_toggle(mf)
+    _flip(mf, toggle, 5)
+    assert _rects(mf) == 3
+
+
+def _clicks(mf):
+    return sum(1 for e in mf.backend.events if e[0] == "click")
+
+
+def test_cycle_takes_the_shorter_way(mf):
+    cycle = mf._affordances["rate_type_lfo1"]
+    states = mf._states[cycle]
+    assert len(states) == 5 and mf._state[cycle] == states[0]
+    assert mf.do(cycle, states[4])
+    assert _clicks(mf) == 4
+    record = {**mf._spec[cycle][states[2]], "reverse": {"button": "right"}}
+    assert mf._cycle(cycle, states[2], record)
+    # two steps back rather than three forward
+    assert _clicks(mf) == 4 + 2
+    assert mf.backend.ui[cycle] == states[2]
+
+
+def test_cycle_corrects_from_readback(mf):
+    cycle = mf._affordances["rate_type_lfo1"]
+    states = mf._states[cycle]
+    mf.backend.ui[cycle] = states[1]
+    assert mf.do(cycle, states[3])
+    assert mf.backend.ui[cycle] == mf._state[cycle] == states[3]
+    assert _clicks(mf) == 3 + 4
+
+
+def _inputs(mf):
+    return [e[0] for e in mf.backend.events if e[0] in ("click", "keys")]
+
+
+@pytest.mark.parametrize(
+    "strategy, inputs",
+    [
+        (Dropdown_Strategy.keys, ["click"] + ["keys"] * 11),
+        (Dropdown_Strategy.batched, ["click", "keys"]),
+        (Dropdown_Strategy.type_ahead, ["click", "keys"]),
+        (Dropdown_Strategy.click, ["click", "click"]),
+    ],
+)
+def test_dropdown_strategies(strategy, inputs):
+    mf = make(dropdown_strategy=strategy)
+    dropdown = mf._affordances["osc_1_mode"]
+    options = {"offset": 30, "item_height": 18}
+    mf._spec = {
+        **mf._spec,
+        dropdown: {
+            s: {**record, "dropdown": options}
+            for s, record in mf._spec[dropdown].items()
+        },
+    }
+    state = mf._states[dropdown][9]
+    assert mf.do(dropdown, state)
+    assert _inputs(mf) == inputs
+    assert mf.backend.ui[dropdown] == state
+
+
+def test_type_ahead_selects_each_item():
+    mf = make(dropdown_strategy=Dropdown_Strategy.type_ahead)
+    dropdown = mf._affordances["osc_1_mode"]
+    changed = []
+    for state in reversed(mf._states[dropdown]):
+        if mf.do(dropdown, state):
+            changed.append(state)
+            assert mf.backend.ui[dropdown] == state
+    typed = [e[1] for e in mf.backend.events if e[0] == "keys"]
+    assert len(typed) == len(changed)
+    # "Harmo" comes first and extends "Harm", so Harm falls back to arrow keys
+    fallback = [s.name for s, keys in zip(changed, typed) if keys.startswith("{VK")]
+    assert fallback == ["Harm"]
+
+
+def test_midi_goes_to_the_backend(mf):
+    slider = next(a for a in mf._programmatic if type(a).__name__ == "Midi_Slider")
+    assert mf.do(slider, 64)
+    msg = mf.backend.messages[-1]
+    assert msg.type == "control_change" and msg.value == 64
+
+
+def test_hires_messages():
+    mf = make(
+        hires={
+            Mf_Midi_Slider.mod_wheel: ("cc14", 33),
+            Mf_Midi_Slider.glide: ("nrpn", 1, 2),
+        }
+    )
+    value = round(0.3 * 16383)
+    msb, lsb = value >> 7, value & 0x7F
+    assert mf.do(mf._affordances["mod_wheel"], 0.3)
+    assert mf.do(mf._affordances["glide"], 0.3)
+    sent = [(m.control, m.value) for m in mf.backend.messages]
+    assert sent == [(1, msb), (33, lsb), (99, 1), (98, 2), (6, msb), (38, lsb)]
+    assert mf._state[mf._affordances["glide"]] == value / 16383
+
+
+def test_async_actions_reach_the_backend(mf):
+    toggle = _shown_toggle(mf)
+    slider = mf._affordances["mod_wheel"]
+    assert asyncio.run(mf.do_async(toggle, Toggle_State.On))
+    assert asyncio.run(mf.do_async(slider, 32))
+    assert mf.backend.ui[toggle] is Toggle_State.On
+    gui = {
+        a: s
+        for a, s in _gui_targets(mf, 200, seed=6)
+        if mf.plan(a, s) == [] and s != mf._state[a] and a not in mf._views
+    }
+    target = {**gui, slider: 96}
+    report = asyncio.run(mf.apply_async(target, settle=False))
+    assert set(report["applied"]) == set(target.items())
+    assert all(mf.backend.ui[a] == s for a, s in gui.items())
+    assert mf.backend.messages[-1].value == 96
+
+
+def test_adaptive_settle_waits_for_redraw():
+    mf = make(backend=Fake_Backend(latency={"redraw": 0.02}), adaptive_settle=True)
+    toggle = _shown_toggle(mf)
+    for _ in range(4):
+        on = mf._state[toggle] is Toggle_State.On
+        assert mf.do(toggle, Toggle_State.Off if on else Toggle_State.On)
+        assert mf.backend.read(toggle) is mf._state[toggle]
+    stats = mf.settler.stats()["Click_Toggle"]
+    assert stats["n"] == 4 and stats["p50_s"] >= 0.02 and not stats["timeouts"]
+
+
+def _drags(mf):
+    return sum(1 for e in mf.backend.events if e[0] == "drag")
+
+
+def _shown_slider(mf):
+    return next(
+        a
+        for a in mf._state
+        if type(a).__name__ == "Click_Rel_Slider" and mf.plan(a, mf._state[a]) == []
+    )
+
+
+def test_rel_slider_learns_its_drag_model():
+    mf = make(slider_strategy=Slider_Strategy.drag)
+    slider = _shown_slider(mf)
+    states = mf._states[slider]
+    rnd = random.Random(1)
+    drags = []
+    for _ in range(8):
+        before = _drags(mf)
+        target = rnd.randint(states.low + 1, states.high - 1)
+        assert mf.do(slider, target)
+        assert mf.backend.ui[slider] == mf._state[slider] == target
+        drags.append(_drags(mf) - before)
+    # the first drag uses the guess and is corrected; later ones land directly
+    assert drags[0] == 2 and drags[-5:] == [1] * 5
+
+
+@pytest.mark.parametrize(
+    "latency, chosen",
+    [
+        ({"click": 0.0, "wheel": 0.0, "tick": 0.002}, Slider_Strategy.drag),
+        ({"click": 0.03, "wheel": 0.0, "tick": 0.0}, Slider_Strategy.wheel),
+    ],
+)
+def test_slider_strategy_follows_measured_cost(latency, chosen):
+    mf = make(backend=Fake_Backend(latency=latency))
+    slider = _shown_slider(mf)
+    states = mf._states[slider]
+    rnd = random.Random(2)
+    for _ in range(10):
+        target = rnd.randint(states.low + 1, states.high - 1)
+        assert mf.do(slider, target)
+        assert mf.backend.ui[slider] == mf._state[slider] == target
+    assert mf._slider_strategy_for(slider) is chosen
+    mf.backend.events.clear()
+    assert mf.do(
+        slider, states.low + 1 if target > states.low + 10 else states.high - 1
+    )
+    assert mf.backend.events[0][0] == chosen.name
+
+
+def test_sync_recovers_gui_state(mf):
+    backend = mf.backend
+    start = mf.snapshot()
+    mf.apply(next(Patch_Sampler(mf, density=0.3, seed=7).patches(1)))
+    mf._vec[:] = type(mf._vec)("q", start)
+    report = mf.sync()
+    assert report["read"]
+    assert all(backend.ui[a] == mf.state[a] for a in report["read"])
+
+
+def test_blind_sliders_are_unverified():
+    class Blind(Fake_Backend):
+        def read(self, affordance):
+            return None
+
+    mf = make(backend=Blind())
+    slider, state = next(
+        (a, mf._states[a][-1])
+        for a in mf._state
+        if type(a).__name__ == "Click_Rel_Slider"
+        and mf.plan(a, mf._states[a][-1]) is not None
+    )
+    report = mf.apply({slider: state})
+    assert report["unverified"] == [(slider, state)]
+    assert slider in mf.unverified
+
+
+def test_adaptive_settle_needs_readback():
+    class Blind(Fake_Backend):
+        read = Backend.read
+
+    with pytest.raises(ValueError):
+        make(backend=Blind(), adaptive_settle=True)
+    assert make(backend=Blind(), adaptive_settle=True, screen_readback=True).can_read()
+
+
+def test_apply_skips_values_already_set():
+    mf = make(hires={Mf_Midi_Slider.mod_wheel: ("cc14", 33)})
+    slider = next(a for a in mf._state if isinstance(mf._states[a], Float_Domain))
+    assert mf.apply({slider: 0.5})["applied"]
+    assert mf.apply({slider: 0.5}) == {
+        "applied": [],
+        "navigated": [],
+        "skipped": [],
+        "unverified": [],
+    }
+
+
+def test_unread_controls_are_applied_after_sync():
+    class Blind(Fake_Backend):
+        read = Backend.read
+
+    mf = make(backend=Blind(), screen_readback=True)
+    mf.verifier.calibrate()
+    names = ("osc_1_mode", "filter_type", "fx1_type")
+    controls = [mf._affordances[name] for name in names]
+    defaults = {a: mf.state[a] for a in controls}
+    for a in controls:
+        mf.backend.ui[a] = mf._states[a][1]
+    report = mf.sync()
+    assert set(controls) <= set(report["unread"]) and set(controls) <= mf.unverified
+    applied = mf.apply(defaults)["applied"]
+    assert set(applied) == set(defaults.items())
+    assert all(mf.backend.ui[a] == s for a, s in defaults.items())
+    assert not set(controls) & mf.unverified
+
+
+def test_apply_async_overlaps_gui_and_midi():
+    mf = make(backend=Fake_Backend(latency={"click": 0.01, "midi": 0.01}))
+    gui = dict(
+        (a, s)
+        for a, s in _gui_targets(mf, 200, seed=2)
+        if mf.plan(a, s) == [] and s != mf.state[a] and a not in mf._views
+    )
+    gui = dict(list(gui.items())[:6])
+    midi = {
+        a: (mf._ordinal(a, mf.state[a]) + 64) % 128
+        for a in mf._programmatic
+        if type(a).__name__ == "Midi_Slider"
+    }
+    midi = dict(list(midi.items())[:6])
+    report = asyncio.run(mf.apply_async({**gui, **midi}, settle=False))
+    assert len(report["applied"]) == len(gui) + len(midi)
+    kinds = [e[0] for e in mf.backend.events if e[0] in ("click", "midi")]
+    first_click, last_click = kinds.index("click"), len(kinds) - kinds[::-1].index(
+        "click"
+    )
+    assert "midi" in kinds[first_click:last_click]
+
+
+def test_calibrated_blind_sliders_land_exactly():
+    class Blind(Fake_Backend):
+        read = Backend.read
+
+    mf = make(backend=Blind(drag_scale=1.3))
+    sliders = [
+        a
+        for a in mf._state
+        if type(a).__name__ == "Click_Rel_Slider" and mf.plan(a, mf.state[a]) == []
+    ][:3] + [mf._affordances["bend_range_settings_wheels"]]
+    target = {a: mf._states[a][2 * len(mf._states[a]) // 3] for a in sliders}
+    mf.apply(target)
+    assert any(mf.backend.ui[a] != s for a, s in target.items())
+    calibrated = mf.calibrate_sliders(sliders)
+    assert set(calibrated) == {a.name for a in sliders}
+    assert all(mf.backend.ui[a] == mf._states[a].low == mf.state[a] for a in sliders)
+    mf.apply(target)
+    assert all(mf.backend.ui[a] == s for a, s in target.items())
+
+
+def test_slider_strategy_per_slider():
+    class Blind(Fake_Backend):
+        read = Backend.read
+
+    wheel = "bend_range_settings_wheels"
+    mf = make(backend=Blind(), slider_strategy={wheel: Slider_Strategy.wheel})
+    sliders = [mf._affordances[wheel]] + [
+        a
+        for a in mf._state
+        if type(a).__name__ == "Click_Rel_Slider" and mf.plan(a, mf.state[a]) == []
+    ][:1]
+    mf.calibrate_sliders(sliders)
+    for a in sliders:
+        del mf.backend.events[:]
+        mf.apply({a: mf._states[a][len(mf._states[a]) // 2]})
+        kinds = {e[0] for e in mf.backend.events} & {"drag", "wheel"}
+        assert kinds == {"wheel" if a.name == wheel else "drag"}
+    with pytest.raises(ValueError):
+        make(slider_strategy={"tempo": Slider_Strategy.wheel})
+
+
+def test_hires_needs_explicit_paths():
+    with pytest.raises(ValueError):
+        make(hires=True)
+
+
+def test_snapshot_roundtrip(mf):
+    patch = dict(_gui_targets(mf, 40, seed=5))
+    start = mf.snapshot()
+    target = mf.snapshot(patch)
+    assert mf.snapshot() == start
+    decoded = mf.decode(target)
+    assert all(decoded[a] == s for a, s in patch.items())
+    assert mf.diff(start, target) == {
+        a: s for a, s in patch.items() if mf.state[a] != s
+    }
+    assert mf.fingerprint(target) != mf.fingerprint()
+    view = next(iter(mf._views))
+    moved = mf.snapshot({**patch, view: mf._states[view][-1]})
+    assert mf.patch_from_snapshot(moved) == {
+        a: s for a, s in patch.items() if mf.state[a] != s and a not in mf._views
+    }
+
+
+def test_apply_rejects_invalid_state(mf):
+    toggle = next(a for a in mf._state if type(a).__name__ == "Click_Toggle")
+    with pytest.raises(ValueError):
+        mf.apply({toggle: "loud"})
+
+
+def test_specs_are_frozen(mf):
+    dropdown = mf._affordances["osc_1_mode"]
+    record = mf._spec[dropdown][mf._states[dropdown][0]]
+    assert isinstance(record, Frozen_Dict)
+    with pytest.raises(TypeError):
+        record["point"] = (0, 0)
+    with pytest.raises(TypeError):
+        mf._spec[dropdown].clear()
+    spec = pickle.loads(pickle.dumps(record))
+    assert isinstance(spec, Frozen_Dict) and spec == record
+
+
+def test_affordance_cache_matches_fresh_build(tmp_path, monkeypatch):
+    def rebuild(self):
+        raise AssertionError("the affordance cache was not used")
+
+    cache = str(tmp_path / "affordances.cache")
+    built = MiniFreak(
+        backend=Fake_Backend(), affordance_cache=cache, slider_model_cache=None
+    )
+    monkeypatch.setattr(MiniFreak, "_add_affordances", rebuild)
+    loaded = MiniFreak(
+        backend=Fake_Backend(), affordance_cache=cache, slider_model_cache=None
+    )
+    assert [a.name for a in built._state] == [a.name for a in loaded._state]
+    assert built.snapshot() == loaded.snapshot()
+    for a, b in zip(built._state, loaded._state):
+        assert built._states[a] == loaded._states[b]
+        assert built._spec[a] == loaded._spec[b]
+        assert built._checks.get(a) == loaded._checks.get(b)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from patches import Patch_Sampler, Patch_Scheduler
+
+
+def test_sampler_respects_constraints(mf):
+    sampler = Patch_Sampler(mf, density=0.5, seed=3)
+    vec, mask = sampler.sample(500)
+    for _, pos, _, per_state in sampler._columns:
+        if per_state is None:
+            continue
+        for s, dnf in enumerate(per_state):
+            rows = mask[:, pos] & (vec[:, pos] == s)
+            assert sampler._holds(dnf, vec[rows]).all()
+
+
+def test_sampler_is_reproducible(mf):
+    a = Patch_Sampler(mf, density=0.3, seed=11).sample(64)
+    b = Patch_Sampler(mf, density=0.3, seed=11).sample(64)
+    assert all(np.array_equal(x, y) for x, y in zip(a, b))
+
+
+def test_stratified_sampling_covers_states(mf):
+    sampler = Patch_Sampler(mf, density=1.0, seed=5, stratified=True)
+    vec, mask = sampler.sample(2048)
+    coverage = sampler.coverage(vec, mask)
+    assert np.mean(list(coverage.values())) > 0.9
+
+
+def test_sampled_patches_apply_without_skips(mf):
+    for patch in Patch_Sampler(mf, density=0.2, seed=8).patches(8):
+        assert not mf.apply(patch)["skipped"]
+
+
+def test_scheduler_orders_a_permutation(mf):
+    snapshots = list(Patch_Sampler(mf, density=0.3, seed=9).snapshots(24))
+    scheduler = Patch_Scheduler(mf)
+    order, report = scheduler.order(snapshots)
+    assert sorted(order) == list(range(len(snapshots)))
+    assert report["ordered"] <= report["initial"]
+
+
+def test_scheduler_targets_reach_each_snapshot(mf):
+    snapshots = list(Patch_Sampler(mf, density=0.2, seed=10).snapshots(6))
+    scheduler = Patch_Scheduler(mf)
+    order, _ = scheduler.order(snapshots)
+    views = {mf._order[v] for v in mf._views}
+    keep = [i for i in range(len(mf._layout)) if i not in views]
+    for i, target in zip(order, scheduler.targets(snapshots, order)):
+        mf.apply({a: s for a, s in target.items() if a not in mf._views})
+        current = np.frombuffer(mf.snapshot(), dtype=np.int64)[keep]
+        expected = np.frombuffer(snapshots[i], dtype=np.int64)[keep]
+        assert np.array_equal(current, expected)
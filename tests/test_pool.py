@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from pool import Worker_Pool, instances
+
+
+def value(mf, patch):
+    value = next(iter(patch.values()))
+    if value == 126:
+        raise ValueError("bad patch")
+    if value == 127:
+        os._exit(3)
+    return value
+
+
+def patches(values):
+    return [{("Midi_Slider", "mod_wheel"): v} for v in values]
+
+
+@pytest.fixture(scope="module")
+def pool():
+    configs = instances(
+        2, backend="fake", affordance_cache=None, slider_model_cache=None
+    )
+    with Worker_Pool(configs, job=value, chunk=2, poll=0.2) as pool:
+        yield pool
+
+
+def test_map_keeps_order(pool):
+    assert pool.map(patches(range(20))) == list(range(20))
+
+
+def test_failed_map_does_not_leak_into_next(pool):
+    with pytest.raises(RuntimeError):
+        pool.map(patches([126 if i == 1 else 60 + i for i in range(30)]))
+    assert pool.map(patches(range(30))) == list(range(30))
+
+
+def test_dead_worker_is_reported():
+    configs = instances(
+        1, backend="fake", affordance_cache=None, slider_model_cache=None
+    )
+    with Worker_Pool(configs, job=value, poll=0.2) as pool:
+        with pytest.raises(RuntimeError, match="exited"):
+            pool.map(patches([127]))
@@ -0,0 +1,55 @@
+import wave
+
+import numpy as np
+
+from patches import Patch_Sampler
+from render import File_Capture, Render_Pipeline, Shard_Writer, program_events
+
+
+def _wav(path, samplerate=8000):
+    tone = (np.sin(np.arange(samplerate) / 5.0) * 20000).astype(np.int16)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(samplerate)
+        f.writeframes(tone.tobytes())
+
+
+def test_repeated_notes_retrigger():
+    events = program_events(((0.0, 60, 100, 0.5), (0.5, 60, 90, 0.5)))
+    assert [e[1] for e in events] == ["note_on", "note_off", "note_on", "note_off"]
+
+
+def test_render_writes_shards(mf, tmp_path, monkeypatch):
+    _wav(tmp_path / "tone.wav")
+    capture = File_Capture(str(tmp_path / "tone.wav"))
+    writer = Shard_Writer(str(tmp_path / "out"), mf._layout, shard_size=2)
+    program = ((0.0, 60, 100, 0.02),)
+    pipeline = Render_Pipeline(
+        mf, capture, writer, program=program, settle=0.0, tail=0.01
+    )
+    applied, apply = [], mf.apply
+
+    def record(patch):
+        report = apply(patch)
+        applied.append(mf.snapshot())
+        return report
+
+    monkeypatch.setattr(mf, "apply", record)
+    patches = list(Patch_Sampler(mf, density=0.2, seed=6).patches(3))
+    report = pipeline.render(patches)
+    assert report["patches"] == 3 and not report["skipped"]
+    assert len(report["shards"]) == 2
+
+    shards = [np.load(path) for path in report["shards"]]
+    vectors = np.concatenate([s["patches"] for s in shards])
+    frames = int(round(0.03 * capture.samplerate))
+    for shard in shards:
+        assert shard["audio"].shape[1:] == (frames, 1)
+        assert int(shard["samplerate"]) == capture.samplerate
+        assert list(shard["layout"]) == [
+            f"{type(a).__name__}.{a.name}" for a in mf._layout
+        ]
+    assert [v.tobytes() for v in vectors] == applied
+    notes = [(m.type, m.note) for m in mf.backend.messages if m.type.startswith("note")]
+    assert notes == [("note_on", 60), ("note_off", 60)] * 3
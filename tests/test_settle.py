@@ -0,0 +1,19 @@
+import pytest
+
+from settle import Settle_Estimator
+
+
+def test_prior_until_enough_samples():
+    settler = Settle_Estimator({"Click_Toggle": 0.1}, min_samples=4, margin=1.5)
+    for _ in range(3):
+        settler.observe("Click_Toggle", 0.02)
+    assert settler.delay("Click_Toggle") == 0.1
+    settler.observe("Click_Toggle", 0.02)
+    assert settler.delay("Click_Toggle") == pytest.approx(0.03)
+
+
+def test_delay_is_clamped():
+    settler = Settle_Estimator({}, min_samples=1, floor=0.01, ceiling=0.5)
+    assert settler.delay("Click_Select") == 0.01
+    settler.observe("Click_Select", 3.0)
+    assert settler.delay("Click_Select") == 0.5
@@ -0,0 +1,28 @@
+import pytest
+
+from patches import Patch_Sampler
+from verify import Screen_Verifier
+
+
+def test_verify_requires_calibration(mf):
+    with pytest.raises(RuntimeError):
+        Screen_Verifier(mf).verify()
+
+
+def test_detects_and_fixes_drift(mf):
+    verifier = Screen_Verifier(mf)
+    verifier.calibrate()
+    mf.apply(next(Patch_Sampler(mf, density=0.2, seed=5).patches(1)))
+    visible = verifier._visible(mf._vec)
+    toggle = next(
+        verifier._owners[i]
+        for i in range(len(visible))
+        if visible[i] and type(verifier._owners[i]).__name__ == "Click_Toggle"
+    )
+    states = mf._states[toggle]
+    drifted = states[1 - states.index(mf.state[toggle])]
+    mf.backend.ui[toggle] = drifted
+    result = verifier.verify(fix=True)
+    assert [m[0] for m in result["mismatches"]] == [toggle]
+    assert mf.state[toggle] == drifted
+    assert verifier.read(toggle) == drifted
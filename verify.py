@@ -0,0 +1,157 @@
+from array import array
+
+import numpy as np
+
+from minifreak import Toggle_State, _holds
+
+
+class Screen_Verifier:
+    def __init__(self, mf, radius=1, rate=0.2):
+        self.mf = mf
+        self.radius = radius
+        self.rate = rate
+        points, owners, on, checks, keys = [], [], [], [], []
+        types = mf._affordance_types
+        for afford in types.Click_Select.value:
+            for state, record in mf._spec[afford].items():
+                points.append(record["point"])
+                owners.append(afford)
+                on.append(mf._ordinal(afford, state))
+                checks.append(mf._checks[afford][state])
+                keys.append(state)
+        for afford in types.Click_Toggle.value:
+            for point in mf._spec[afford]:
+                points.append(point)
+                owners.append(afford)
+                on.append(mf._ordinal(afford, Toggle_State.On))
+                checks.append(mf._checks[afford][point])
+                keys.append(None)
+        self._owners, self._keys, self._checks = owners, keys, checks
+        self._points = np.array(points, dtype=float).reshape(-1, 2)
+        self._positions = np.array([mf._order[a] for a in owners], dtype=np.int64)
+        self._on = np.array(on, dtype=np.int64)
+        # per point reference colors: [:, 0] when off/unselected, [:, 1] when on/selected
+        self.references = np.full((len(points), 2, 3), np.nan)
+        r = np.arange(-radius, radius + 1)
+        self._dy, self._dx = (a.ravel() for a in np.meshgrid(r, r, indexing="ij"))
+
+    def _visible(self, vec):
+        visible = np.array([_holds(check, vec) for check in self._checks], dtype=bool)
+        # points shared by several visible controls cannot be attributed
+        keys = np.round(self._points[visible], 4)
+        _, inverse, counts = np.unique(
+            keys, axis=0, return_inverse=True, return_counts=True
+        )
+        visible[np.flatnonzero(visible)[counts[inverse.ravel()] > 1]] = False
+        return visible
+
+    @property
+    def calibrated(self):
+        return bool((~np.isnan(self.references[:, :, 0])).any(axis=0).all())
+
+    def _sample(self, image, rows=slice(None)):
+        h, w = image.shape[:2]
+        r = self.radius
+        points = self._points[rows]
+        x = np.clip(np.rint(points[:, 0] * w).astype(np.int64), r, w - 1 - r)
+        y = np.clip(np.rint(points[:, 1] * h).astype(np.int64), r, h - 1 - r)
+        pixels = image[y[:, None] + self._dy, x[:, None] + self._dx, :3]
+        return pixels.astype(float).mean(axis=1)
+
+    def _observe(self, colors, rows=slice(None)):
+        known = ~np.isnan(self.references[rows, :, 0])
+        fallback = np.nanmean(self.references, axis=0)
+        refs = np.where(known[:, :, None], self.references[rows], fallback[None])
+        distance = np.linalg.norm(colors[:, None, :] - refs, axis=2)
+        return distance[:, 1] < distance[:, 0]
+
+    def _learn(self, rows, on, colors):
+        ref = self.references[rows, on]
+        fresh = np.isnan(ref[:, 0])
+        ref[fresh] = colors[fresh]
+        ref[~fresh] += self.rate * (colors[~fresh] - ref[~fresh])
+        self.references[rows, on] = ref
+
+    def calibrate(self, image=None):
+        image = self.mf.backend.capture() if image is None else image
+        vec = np.frombuffer(self.mf.snapshot(), dtype=np.int64)
+        rows = np.flatnonzero(self._visible(self.mf._vec))
+        expected = (vec[self._positions] == self._on)[rows]
+        self._learn(rows, expected.astype(np.int64), self._sample(image)[rows])
+        return len(rows)
+
+    def _shown(self, afford, rows, observed):
+        if type(afford).__name__ == "Click_Toggle":
+            return Toggle_State.On if observed[rows].any() else Toggle_State.Off
+        lit = [self._keys[i] for i in rows if observed[i]]
+        return lit[0] if len(lit) == 1 else None
+
+    def verify(self, image=None, fix=False, learn=True):
+        mf = self.mf
+        # calibrating here would learn colours from a model that may already have drifted
+        if not self.calibrated:
+            raise RuntimeError(
+                "verify: verifier is not calibrated; call calibrate() first"
+            )
+        image = mf.backend.capture() if image is None else image
+        colors = self._sample(image)
+        observed = self._observe(colors)
+
+        # a wrong tab changes what is on screen, so views are settled first and
+        # the remaining controls are judged under the views actually shown
+        work = array("q", mf._vec)
+        for _ in range(len(mf._views) + 1):
+            visible = self._visible(work)
+            expected = np.frombuffer(work, dtype=np.int64)[self._positions] == self._on
+            wrong = visible & (observed != expected)
+            settled = True
+            for afford in dict.fromkeys(self._owners[i] for i in np.flatnonzero(wrong)):
+                if afford in mf._views:
+                    shown = self._shown(afford, self._rows(afford, visible), observed)
+                    if shown is not None:
+                        work[mf._order[afford]] = mf._ordinal(afford, shown)
+                        settled = False
+            if settled:
+                break
+
+        if learn:
+            rows = np.flatnonzero(visible & ~wrong)
+            self._learn(rows, expected[rows].astype(np.int64), colors[rows])
+
+        mismatches = []
+        views = [v for v in mf._views if work[mf._order[v]] != mf._vec[mf._order[v]]]
+        for afford in views:
+            shown = mf._states[afford][work[mf._order[afford]]]
+            mismatches.append((afford, mf.state[afford], shown))
+        for afford in dict.fromkeys(self._owners[i] for i in np.flatnonzero(wrong)):
+            if afford not in views:
+                shown = self._shown(afford, self._rows(afford, visible), observed)
+                mismatches.append((afford, mf.state[afford], shown))
+        if fix:
+            for afford, _, shown in mismatches:
+                if shown is not None:
+                    mf._set(afford, mf._ordinal(afford, shown))
+        return {
+            "checked": int(visible.sum()),
+            "verified": list(
+                dict.fromkeys(self._owners[i] for i in np.flatnonzero(visible))
+            ),
+            "mismatches": mismatches,
+        }
+
+    def read(self, afford, image=None):
+        # the shown state of one select or toggle, or None when it cannot be told
+        if not self.calibrated:
+            raise RuntimeError(
+                "read: verifier is not calibrated; call calibrate() first"
+            )
+        rows = self._rows(afford, self._visible(self.mf._vec))
+        if not rows:
+            return None
+        image = self.mf.backend.capture() if image is None else image
+        observed = np.zeros(len(self._owners), dtype=bool)
+        observed[rows] = self._observe(self._sample(image, rows), rows)
+        return self._shown(afford, rows, observed)
+
+    def _rows(self, afford, visible):
+        return [i for i in np.flatnonzero(visible) if self._owners[i] is afford]